@@ -0,0 +1,40 @@
+# Bench_parsing.py compares the lxml parsing in parsing.py against the previous BeautifulSoup html.parser path
+# Run from the repository root: python benchmarks/bench_parsing.py
+
+import os
+import sys
+from bs4 import BeautifulSoup
+from timeit import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from parsing import parse_job_details, parse_job_listings
+from synthetic import make_details_page, make_search_page
+
+# The previous parsing path: a full html.parser tree and find() with the class strings
+def soup_listings(page_source):
+    soup = BeautifulSoup(page_source, "html.parser")
+    results = []
+    for job_listing in soup.find_all('div', class_='job_seen_beacon'):
+        results.append((job_listing.find("a")["id"], job_listing.find("a").find("span").text.strip(),
+                        job_listing.find('span', class_='css-63koeb eu4oa1w0').text.strip(),
+                        job_listing.find('div', class_='css-1p0sjhy eu4oa1w0').text.strip()))
+    return results
+
+def soup_details(page_source):
+    soup = BeautifulSoup(page_source, "html.parser")
+    return (soup.find('span', class_="css-19j1a75 eu4oa1w0").text.strip(),
+            soup.find('span', class_='css-k5flys eu4oa1w0').text.strip(),
+            soup.find(id="jobDescriptionText", class_="jobsearch-JobComponent-description css-16y4thd eu4oa1w0").text)
+
+def main(number=50):
+    search_page = make_search_page()
+    details_page = make_details_page('\n\n'.join(f'Paragraph {i}: we build data pipelines with Python, SQL, Spark and Airflow on Azure.' for i in range(200)))
+    for name, old, new, page in [('search page', soup_listings, parse_job_listings, search_page),
+                                 ('details page', soup_details, parse_job_details, details_page)]:
+        old_ms = timeit(lambda: old(page), number=number) / number * 1000
+        new_ms = timeit(lambda: new(page), number=number) / number * 1000
+        print(f"{name} ({len(page) // 1024} KB): html.parser {old_ms:.2f} ms, lxml {new_ms:.2f} ms, {old_ms / new_ms:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
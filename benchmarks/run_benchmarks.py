@@ -0,0 +1,221 @@
+# Run_benchmarks.py times parsing, cleaning, skill matching and serialization on synthetic data (see synthetic.py)
+# and writes the results as JSON, so that runs on different commits can be compared
+# Run from the repository root:
+#   python benchmarks/run_benchmarks.py --output before.json
+#   python benchmarks/run_benchmarks.py --compare before.json
+# With --load, the end-to-end benchmark also transforms and loads the data into the PostgreSQL database in config.py,
+# inside a scratch schema that is dropped afterwards, so point config.py at a local database
+
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import synthetic  # Puts src/ on the import path
+
+import pandas as pd
+from data_eng_skills import data_engineering_skills
+from formats import PROCESSED_SCHEMA, RAW_SCHEMA, read_frame, serialize_frame
+from parsing import parse_job_details, parse_job_listings
+from skill_cache import match_series_cached
+from skill_matcher import get_skill_matcher
+from transform import clean_data, process_data
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+# Search results pages have 15 cards, one details page is parsed for every 100 rows
+CARDS_PER_PAGE = 15
+ROWS_PER_DETAILS_PAGE = 100
+
+# Best time of repeat runs of function, setup prepares the argument of each run without being timed
+def timed(function, setup=None, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        if setup:
+            argument = setup()
+            start = perf_counter()
+            function(argument)
+        else:
+            start = perf_counter()
+            function()
+        best = min(best, perf_counter() - start)
+    return best
+
+# One result in the report
+def result(benchmark, rows, seconds, **extra):
+    print(f"{benchmark:<28} {rows:>9} rows {seconds:>10.4f} s {rows / seconds if seconds else 0:>14,.0f} rows/s")
+    return {'benchmark': benchmark, 'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds else None, **extra}
+
+# Skills of a description the way transform.py found them before skill_matcher.py, one substring check per variation
+def substring_loop_skills(description, skills_dict):
+    found_skills = []
+    description_lower = description.lower()
+    if re.search(r'\b(R\b|R,|R programming|R language|R studio)\b', description, re.IGNORECASE):
+        found_skills.append('R')
+    for skill, variations in skills_dict.items():
+        if any(variation.lower() in description_lower for variation in variations):
+            found_skills.append(skill)
+    return found_skills
+
+# Empty the skill cache, so that each distinct description is matched once again
+def clear_skill_cache(cache_path):
+    with sqlite3.connect(cache_path) as conn:
+        conn.execute("DELETE FROM skill_cache")
+
+# Parse search results pages holding size listing cards, and one details page per ROWS_PER_DETAILS_PAGE rows
+def bench_parsing(size, repeat):
+    search_pages = [synthetic.make_search_page(CARDS_PER_PAGE, offset=i * CARDS_PER_PAGE) for i in range(10)]
+    page_count = math.ceil(size / CARDS_PER_PAGE)
+    seconds = timed(lambda: [parse_job_listings(search_pages[i % 10]) for i in range(page_count)], repeat=repeat)
+    yield result('parse_search_pages', page_count * CARDS_PER_PAGE, seconds)
+
+    details_pages = [synthetic.make_details_page(description) for description in synthetic.make_descriptions(10)]
+    page_count = max(10, size // ROWS_PER_DETAILS_PAGE)
+    seconds = timed(lambda: [parse_job_details(details_pages[i % 10]) for i in range(page_count)], repeat=repeat)
+    yield result('parse_details_pages', page_count, seconds)
+
+# Clean, skill-match and serialize a raw dataframe of size rows
+def bench_dataframes(size, repeat, cache_path):
+    raw = synthetic.make_raw_frame(size)
+
+    seconds = timed(clean_data, setup=raw.copy, repeat=repeat)
+    yield result('clean_data', size, seconds)
+
+    descriptions = raw['Full Job Description']
+    matcher = get_skill_matcher(data_engineering_skills)
+    seconds = timed(lambda: matcher.match_series(descriptions), repeat=repeat)
+    # The substring loop the matcher replaced, for comparison, only up to 100k rows as it is slow
+    if size <= 100000:
+        loop_seconds = timed(lambda: [substring_loop_skills(description, data_engineering_skills) for description in descriptions], repeat=repeat)
+        yield result('match_skills_substring_loop', size, loop_seconds)
+        yield result('match_skills', size, seconds, speedup_vs_substring_loop=round(loop_seconds / seconds, 2))
+    else:
+        yield result('match_skills', size, seconds)
+
+    # With a cold cache each distinct description is matched once, with a warm cache all are read from the cache
+    match_series_cached(descriptions.head(1), data_engineering_skills)
+    seconds = timed(lambda _: match_series_cached(descriptions, data_engineering_skills), setup=lambda: clear_skill_cache(cache_path), repeat=repeat)
+    yield result('match_skills_cold_cache', size, seconds)
+    yield result('match_skills_warm_cache', size, timed(lambda: match_series_cached(descriptions, data_engineering_skills), repeat=repeat))
+
+    processed = process_data(clean_data(raw.copy()))
+    for staging_format in ['csv', 'parquet']:
+        data = serialize_frame(processed, staging_format, PROCESSED_SCHEMA)
+        seconds = timed(lambda: serialize_frame(processed, staging_format, PROCESSED_SCHEMA), repeat=repeat)
+        yield result(f'serialize_{staging_format}', size, seconds, bytes=len(data))
+        seconds = timed(lambda: read_frame(data, staging_format), repeat=repeat)
+        yield result(f'read_{staging_format}', size, seconds, bytes=len(data))
+
+# Extract-to-database run on local disk: raw files are transformed with transform_data and loaded with load_data
+# The database tables are created in a scratch schema, and the row by row load runs only up to 100k rows
+def bench_load(size, work_dir, cache_path):
+    import psycopg2
+    from config import config
+    from load import load_data
+    from storage import get_raw_storage
+    from transform import transform_data
+
+    schema = f'bench_{os.getpid()}'
+    conn = psycopg2.connect(**config())
+    conn.autocommit = True
+    os.environ['PGOPTIONS'] = f'-c search_path={schema}'
+    os.environ['PIPELINE_LOCAL_STORAGE_DIR'] = os.path.join(work_dir, f'load_{size}')
+    try:
+        for bulk in [True, False]:
+            if not bulk and size > 100000:
+                continue
+            conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}")
+            get_raw_storage().write('bench_raw.parquet', serialize_frame(synthetic.make_raw_frame(size), 'parquet', RAW_SCHEMA))
+            clear_skill_cache(cache_path)
+
+            start = perf_counter()
+            transform_data(full_refresh=True)
+            transform_seconds = perf_counter() - start
+            load_data(bulk=bulk)
+            load_seconds = perf_counter() - start - transform_seconds
+
+            if bulk:
+                yield result('end_to_end_transform', size, transform_seconds)
+            yield result('end_to_end_load_bulk' if bulk else 'end_to_end_load_rows', size, load_seconds)
+    finally:
+        os.environ.pop('PGOPTIONS')
+        conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.close()
+
+# Print how each benchmark compares to a baseline report, returns the benchmarks that got slower than threshold allows
+def compare(results, baseline, threshold):
+    baseline_seconds = {(item['benchmark'], item['rows']): item['seconds'] for item in baseline['results']}
+    print(f"\nCompared to {baseline.get('commit')}:")
+    regressions = []
+    for item in results:
+        before = baseline_seconds.get((item['benchmark'], item['rows']))
+        if not before:
+            continue
+        ratio = item['seconds'] / before
+        flag = ' SLOWER' if ratio > threshold else ''
+        print(f"{item['benchmark']:<28} {item['rows']:>9} rows {ratio:>6.2f}x the baseline time{flag}")
+        if flag:
+            regressions.append(item)
+    return regressions
+
+# The commit the benchmarks ran on, if run inside the git repository
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="comma-separated row counts")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the best time is reported")
+    parser.add_argument('--load', action='store_true', help="also run the end-to-end load into the database in config.py")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="compare the results to an earlier JSON report")
+    parser.add_argument('--threshold', type=float, default=1.1, help="time ratio above which a benchmark counts as slower")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Keep everything on local disk and away from the real skill cache
+        cache_path = os.path.join(work_dir, 'skill_cache.sqlite')
+        os.environ['SKILL_CACHE_PATH'] = cache_path
+        os.environ['PIPELINE_STORAGE_BACKEND'] = 'local'
+
+        for size in sizes:
+            # Large sizes take long enough to time with a single run
+            repeat = args.repeat if size <= 100000 else 1
+            results.extend(bench_parsing(size, repeat))
+            results.extend(bench_dataframes(size, repeat, cache_path))
+            if args.load:
+                results.extend(bench_load(size, work_dir, cache_path))
+
+    report = {
+        'commit': current_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            if compare(results, json.load(file), args.threshold):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Synthetic.py generates the data the benchmarks run on, so they need no network, cloud storage or scraped data
+# Search results and job details pages follow the markup parsing.py reads, raw data has the messy salary, location
+# and job type strings clean_data deals with, and job descriptions mention skills from data_eng_skills.py
+# Everything is generated from a seed, so runs on different commits see the same data
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import pandas as pd
+from data_eng_skills import data_engineering_skills
+from formats import RAW_SCHEMA
+
+# Salary, location and job type strings the way they appear on the job site
+SALARIES = ['$120,000 - $150,000 a year', 'From $95,000 a year', '$110,000 a year', '$45 - $60 an hour',
+            '$38.50 an hour', 'Up to $70 an hour', '$85,000 - $105,000 a year', None]
+LOCATIONS = ['Remote in Austin, TX 78701', 'Hybrid work in Seattle, WA 98101', 'New York, NY (Midtown area)', 'Remote',
+             'Chicago, IL 60601', 'Hybrid work in Denver, CO', 'San Francisco, CA 94105 (Financial District area)', None]
+JOB_TYPES = ['Full-time', 'Full-time -', 'Contract', 'Contract, Temporary', 'Permanent', 'Temp-to-hire Full-time',
+             'Part-time, Contract', None]
+
+# Sentences the descriptions are made of, {} is replaced with a variation of a skill
+SKILL_SENTENCES = ['Hands-on experience with {} in production.', 'You will build and maintain pipelines using {}.',
+                   'Familiarity with {} is a plus.', 'Our stack includes {} and more.', 'Strong knowledge of {} (3+ years).']
+FILLER_SENTENCES = ['We are a fast-growing company with a collaborative culture.', 'You will work closely with analysts and data scientists.',
+                    'We offer flexible hours, health insurance and a learning budget.', 'Excellent written and verbal communication skills.',
+                    'Bachelor\'s degree in Computer Science or a related field.', 'Join a team that values ownership and curiosity.']
+
+# A job description mentioning a random handful of skills, each by one of its variations
+def make_description(rng, skills=None):
+    skills = skills or data_engineering_skills
+    names = rng.sample(sorted(skills), rng.randint(2, 12))
+    sentences = [rng.choice(SKILL_SENTENCES).format(rng.choice(skills[name])) for name in names]
+    sentences += rng.choices(FILLER_SENTENCES, k=rng.randint(5, 20))
+    rng.shuffle(sentences)
+    paragraphs = [' '.join(sentences[start:start + 4]) for start in range(0, len(sentences), 4)]
+    return '\n\n'.join(paragraphs)
+
+# A corpus of distinct job descriptions
+def make_descriptions(count, seed=0):
+    rng = random.Random(seed)
+    return [make_description(rng) for _ in range(count)]
+
+# Raw data like extract.py saves it
+# Descriptions are drawn from a corpus of distinct_descriptions, as postings are reposted and found by several searches
+def make_raw_frame(rows, distinct_descriptions=5000, seed=0):
+    rng = random.Random(seed)
+    descriptions = make_descriptions(min(rows, distinct_descriptions), seed)
+    records = [(f'job_{index:016x}', f'Data Engineer {index % 97}', f'Company {index % 1013}', rng.choice(LOCATIONS),
+                rng.choice(SALARIES), rng.choice(JOB_TYPES), rng.choice(descriptions)) for index in range(rows)]
+    return pd.DataFrame(records, columns=RAW_SCHEMA.names)
+
+# A search results page with the given number of job listing cards, between navigation markup
+def make_search_page(cards=15, offset=0):
+    card = ('<div class="job_seen_beacon"><table><tr><td><h2><a id="job_{0:032x}" href="/rc/clk?jk={0:016x}"><span>Data Engineer {0}</span></a></h2>'
+            '<span class="css-63koeb eu4oa1w0">Company {0}</span><div class="css-1p0sjhy eu4oa1w0">Remote in Austin, TX 78701</div>'
+            '<div class="snippet"><ul><li>Build pipelines with Python and SQL.</li></ul></div></td></tr></table></div>')
+    filler = '<div class="nav"><ul>' + '<li><a href="/q">Related search</a></li>' * 200 + '</ul></div>'
+    return '<html><head><title>Jobs</title></head><body>' + filler + ''.join(card.format(offset + i) for i in range(cards)) + filler + '</body></html>'
+
+# A job details page, with a generated description unless one is given
+def make_details_page(description=None, salary='$120,000 - $150,000 a year', job_type='Full-time'):
+    if description is None:
+        description = make_description(random.Random(0))
+    paragraphs = ''.join(f'<p>{paragraph}</p>\n\n' for paragraph in description.split('\n\n'))
+    filler = '<div class="nav"><ul>' + '<li><a href="/q">Similar job</a></li>' * 300 + '</ul></div>'
+    return ('<html><head><title>Data Engineer</title></head><body>' + filler +
+            f'<span class="css-19j1a75 eu4oa1w0">{salary}</span><span class="css-k5flys eu4oa1w0">{job_type}</span>'
+            '<div id="jobDescriptionText" class="jobsearch-JobComponent-description css-16y4thd eu4oa1w0">' + paragraphs + '</div>' + filler + '</body></html>')
@@ -0,0 +1,246 @@
+# Azure_clients.py hands out the Azure clients shared by extract, transform and load
+# The credential, the Key Vault secrets and the blob clients are created once per process and reused,
+# so a pipeline run probes the credential chain once, fetches the storage secret once and reuses its HTTP connections
+# Once the storage secret has expired it is fetched again, and the blob clients are rebuilt if it has been rotated
+# Set AZURE_STORAGE_CONNECTION_STRING to skip Key Vault, e.g. for a local storage emulator like Azurite
+# AzureStorage is the Azure Blob Storage backend of storage.py
+
+import base64
+import io
+import os
+import threading
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity import DefaultAzureCredential
+from azure.keyvault.secrets import SecretClient
+from azure.storage.blob import BlobBlock, BlobServiceClient
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from metrics import count
+from time import monotonic
+
+# How long a secret fetched from Key Vault is reused before it is fetched again
+SECRET_TTL_SECONDS = int(os.environ.get('AZURE_SECRET_TTL_SECONDS', 3600))
+
+_lock = threading.RLock()
+_credential = None
+_secret_client = None
+_secrets = {}
+_blob_service_client = None
+_blob_service_connection_string = None
+_container_clients = {}
+
+# The Azure credential, created on first use
+def get_credential():
+    global _credential
+    with _lock:
+        if _credential is None:
+            _credential = DefaultAzureCredential()
+        return _credential
+
+# A secret from Azure Key Vault, cached for ttl seconds
+def get_secret(name, ttl=SECRET_TTL_SECONDS):
+    global _secret_client
+    with _lock:
+        cached = _secrets.get(name)
+        if cached is not None and monotonic() < cached[1]:
+            return cached[0]
+
+        if _secret_client is None:
+            _secret_client = SecretClient(vault_url=os.environ.get('AZURE_KEY_VAULT_URL'), credential=get_credential())
+        value = _secret_client.get_secret(name).value
+        _secrets[name] = (value, monotonic() + ttl)
+        return value
+
+# The storage connection string, from the environment if set and otherwise from Azure Key Vault
+def get_storage_connection_string():
+    connection_string = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
+    if connection_string:
+        return connection_string
+    return get_secret(os.environ.get('AZURE_STORAGE_CONNECTION_STRING_SECRET_NAME'))
+
+# The process-wide BlobServiceClient, its connection pool is shared by all containers and blobs
+# The client is built again, with new container clients, when the connection string has changed
+def get_blob_service_client():
+    global _blob_service_client, _blob_service_connection_string
+    with _lock:
+        # A client given to set_blob_service_client is used as it is
+        if _blob_service_client is not None and _blob_service_connection_string is None:
+            return _blob_service_client
+
+        connection_string = get_storage_connection_string()
+        if connection_string != _blob_service_connection_string:
+            _blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+            _blob_service_connection_string = connection_string
+            _container_clients.clear()
+        return _blob_service_client
+
+# Use the given client for all blob storage access, e.g. an in-memory fake in tests
+# None goes back to the client built from the storage connection string
+def set_blob_service_client(blob_service_client):
+    global _blob_service_client, _blob_service_connection_string
+    with _lock:
+        _blob_service_client = blob_service_client
+        _blob_service_connection_string = None
+        _container_clients.clear()
+
+# A cached client for a container
+def get_container_client(container_name):
+    with _lock:
+        blob_service_client = get_blob_service_client()
+        container_client = _container_clients.get(container_name)
+        if container_client is None:
+            container_client = blob_service_client.get_container_client(container_name)
+            _container_clients[container_name] = container_client
+        return container_client
+
+# The raw data container
+def get_raw_container_client():
+    return get_container_client(os.environ.get('AZURE_RAW_STORAGE_CONTAINER_NAME'))
+
+# The processed data container
+def get_processed_container_client():
+    return get_container_client(os.environ.get('AZURE_PROCESSED_STORAGE_CONTAINER_NAME'))
+
+# Download blobs with a bounded pool of threads and yield (name, data) pairs in the order of blob_names
+# At most max_workers downloads run ahead of the caller, so downloading overlaps with whatever the caller does with the data
+def download_blobs(container_client, blob_names, max_workers=8):
+    def download(blob_name):
+        return container_client.get_blob_client(blob_name).download_blob().readall()
+
+    blob_names = iter(blob_names)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for blob_name in islice(blob_names, max_workers):
+            pending.append((blob_name, executor.submit(download, blob_name)))
+        while pending:
+            blob_name, future = pending.popleft()
+            for next_name in islice(blob_names, 1):
+                pending.append((next_name, executor.submit(download, next_name)))
+            yield blob_name, future.result()
+
+# Delete blobs with the batch delete API, up to 256 blobs per request
+# Returns the names of the blobs that could not be deleted
+def delete_blobs(container_client, blob_names, batch_size=256):
+    blob_names = list(blob_names)
+    failed = []
+    for start in range(0, len(blob_names), batch_size):
+        batch = blob_names[start:start + batch_size]
+        responses = container_client.delete_blobs(*batch, raise_on_any_failure=False)
+        failed.extend(blob_name for blob_name, response in zip(batch, responses) if response.status_code not in (200, 202))
+    return failed
+
+# File-like view of a downloaded blob that reads its chunks one at a time
+class BlobChunkReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+            count('bytes_read', len(self._chunk))
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+# Writable file object that uploads to a block blob, staging a block whenever block_size bytes have been written
+# The blob is committed when the stream is closed, a with block that raises aborts the upload instead
+class BlockUploadStream(io.RawIOBase):
+    def __init__(self, blob_client, block_size=4 * 1024 * 1024):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.block_list = []
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= self.block_size:
+            self._stage_block()
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def _stage_block(self):
+        block_id = base64.b64encode(f'{len(self.block_list):08d}'.encode('utf-8')).decode('utf-8')
+        self.blob_client.stage_block(block_id, bytes(self._buffer))
+        self.block_list.append(BlobBlock(block_id=block_id))
+        self._buffer.clear()
+
+    def close(self):
+        if not self.closed:
+            if self._buffer or not self.block_list:
+                self._stage_block()
+            self.blob_client.commit_block_list(self.block_list)
+            count('bytes_written', self._position)
+        super().close()
+
+    # Close without committing, the blob keeps its previous contents and Azure discards the uncommitted blocks
+    def abort(self):
+        self.block_list.clear()
+        self._buffer.clear()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# Files in an Azure Blob Storage container
+class AzureStorage:
+    def __init__(self, container_client):
+        self.container_client = container_client
+
+    @property
+    def location(self):
+        return f"container {self.container_client.container_name}"
+
+    # All files by name and ETag
+    def list_files(self):
+        return {blob.name: blob.etag for blob in self.container_client.list_blobs()}
+
+    # The contents of a file as bytes, FileNotFoundError if there is no such file
+    def read(self, name):
+        try:
+            data = self.container_client.get_blob_client(name).download_blob().readall()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(name)
+        count('bytes_read', len(data))
+        return data
+
+    # Yield (name, data) pairs in the order of names, downloading a few files ahead of the caller
+    def read_many(self, names):
+        for name, data in download_blobs(self.container_client, names):
+            count('bytes_read', len(data))
+            yield name, data
+
+    # A binary file object that downloads the file chunk by chunk as it is read
+    def open_read(self, name):
+        return io.BufferedReader(BlobChunkReader(self.container_client.get_blob_client(name).download_blob().chunks()))
+
+    # Write a file, replacing any file of the same name
+    def write(self, name, data):
+        self.container_client.get_blob_client(name).upload_blob(data, overwrite=True)
+        count('bytes_written', len(data))
+
+    # A binary file object that uploads the file in blocks, the file appears once the stream is closed
+    def open_write(self, name):
+        return BlockUploadStream(self.container_client.get_blob_client(name))
+
+    # Delete files with the batch delete API, returns the names of the files that could not be deleted
+    def delete(self, names):
+        return delete_blobs(self.container_client, names)
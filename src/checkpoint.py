@@ -0,0 +1,85 @@
+# Checkpoint.py lets an interrupted crawl resume where it stopped instead of starting over
+# The checkpoint is stored next to the raw data and is updated every time a micro-batch of raw records has been saved.
+# It holds the IDs of the listings saved so far and, for each search query, the start of the first results page
+# whose listings haven't all been saved yet. A finished crawl deletes its checkpoint.
+
+import hashlib
+import json
+import os
+import threading
+from time import time
+
+CHECKPOINT_BLOB_NAME = '_crawl_checkpoint.json'
+
+# Checkpoints older than this are ignored, so a crawl that crashed long ago doesn't hold back the next one
+MAX_AGE_SECONDS = int(os.environ.get('CRAWL_CHECKPOINT_MAX_AGE_SECONDS', 24 * 3600))
+
+# Key of one search query in the checkpoint
+def query_key(job_title, location):
+    return f'{job_title}|{location}'
+
+# Key of a crawl, a checkpoint is only resumed by a crawl with the same queries and pagination
+def run_key(*crawl_parameters):
+    return hashlib.sha256(json.dumps(crawl_parameters, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+class CrawlCheckpoint:
+    def __init__(self, storage, key, max_age=MAX_AGE_SECONDS):
+        self.storage = storage
+        self.key = key
+        self.completed = set()
+        # Start of the first page of each query that isn't saved completely yet, None once a query is finished
+        self.positions = {}
+        self.resumed = False
+        # Listings handed to the fetch workers but not saved yet, by job ID, with their query and page
+        self._outstanding = {}
+        # Start of the next page of each query the crawl would fetch, None once its results have run out
+        self._next_pages = {}
+        self._lock = threading.Lock()
+
+        try:
+            saved = json.loads(bytes(storage.read(CHECKPOINT_BLOB_NAME)))
+        except FileNotFoundError:
+            return
+        if saved['run_key'] == key and time() - saved['updated_at'] < max_age:
+            self.completed = set(saved['completed'])
+            self.positions = saved['positions']
+            self.resumed = True
+            print(f"Resuming the crawl from its checkpoint, {len(self.completed)} job listings were saved before.")
+
+    # Where a query continues: its checkpointed page, the given start if it wasn't reached yet, None if it is finished
+    def resume_start(self, query, start):
+        return self.positions.get(query, start)
+
+    def is_completed(self, job_id):
+        return job_id in self.completed
+
+    # Record the listings of a results page that were handed to the fetch workers, and where the query goes on
+    def page_scheduled(self, query, page_start, job_ids, next_start):
+        with self._lock:
+            for job_id in job_ids:
+                self._outstanding[job_id] = (query, page_start)
+            self._next_pages[query] = next_start
+
+    # Record that the results of a query have run out
+    def query_finished(self, query):
+        with self._lock:
+            self._next_pages[query] = None
+
+    # Mark listings as saved and write the checkpoint
+    def save(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self.completed.add(job_id)
+                self._outstanding.pop(job_id, None)
+
+            # A query resumes from the earliest page that still has unsaved listings
+            for query, next_start in self._next_pages.items():
+                outstanding_pages = [page_start for outstanding_query, page_start in self._outstanding.values() if outstanding_query == query]
+                self.positions[query] = min(outstanding_pages) if outstanding_pages else next_start
+
+            checkpoint = {'run_key': self.key, 'updated_at': time(), 'completed': sorted(self.completed), 'positions': self.positions}
+        self.storage.write(CHECKPOINT_BLOB_NAME, json.dumps(checkpoint, indent=2).encode('utf-8'))
+
+    # Delete the checkpoint once the crawl has finished
+    def clear(self):
+        self.storage.delete([CHECKPOINT_BLOB_NAME])
@@ -0,0 +1,149 @@
+# Crawl.py schedules one crawl over several search queries and locations
+# Each search is followed through its result pages until no new listings show up or the budget runs out
+# Details pages of new listings are handed to the fetch workers as soon as their search page is parsed
+
+from checkpoint import CrawlCheckpoint, query_key, run_key
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from driver_pool import DriverPool
+from extract import get_job_data, get_job_listings, options, save_raw_batches
+from fetchers import build_fetcher
+from itertools import product
+from metrics import count, span
+from seen_jobs import open_seen_jobs_index
+from storage import get_raw_storage
+from throttle import AdaptiveRateLimiter
+from time import monotonic
+
+# Build the search URL for one query, location and result offset
+# The first page has to be requested without the start parameter
+def build_search_url(base_url, job_title, location, sort, start=0):
+    url = f"{base_url}/jobs?q=\"{job_title}\"&l=\"{location}\"&sort={sort}"
+    if start:
+        url += f"&start={start}"
+    return url
+
+# Crawl all combinations of job titles and locations and yield the job data of each new listing as soon as it is ready
+# The listings are yielded in the order they were found
+# page_size is how much the start parameter grows per results page
+# max_search_pages limits the number of results pages over the whole crawl, time_budget is in seconds
+# Listings already in the seen_jobs index (see seen_jobs.py) are not opened again
+# With a checkpoint (see checkpoint.py), each query continues from its checkpointed page and saved listings are skipped
+# At most max_pending listings (4 per worker by default) wait for their details page, the next results page is only
+# fetched once there is room. If the caller stops early, the listings that haven't been started are cancelled.
+def crawl_job_data(job_titles, locations, sort, base_url, start=0, page_size=10, max_search_pages=None, time_budget=None,
+                   workers=1, requests_per_second=0.5, max_pages=10, backend='http', seen_jobs=None, checkpoint=None,
+                   max_pending=None):
+    max_pending = max_pending or 4 * workers
+    rate_limiter = AdaptiveRateLimiter(requests_per_second)
+    deadline = monotonic() + time_budget if time_budget else None
+    search_pages = 0
+
+    # Listings are deduplicated by their job ID across all queries and pages
+    seen_job_ids = set()
+    pending = deque()
+    extracted = 0
+
+    def budget_left():
+        if max_search_pages is not None and search_pages >= max_search_pages:
+            return False
+        return deadline is None or monotonic() < deadline
+
+    # Yield the data of the oldest pending listing once it is done, dropping listings whose details couldn't be fetched
+    # so that they are retried by the next run
+    def take_oldest():
+        nonlocal extracted
+        data = pending.popleft().result()
+        if data is None:
+            return
+        extracted += 1
+        count('rows_extracted')
+        print(f"Successfully extracted data for job listing {extracted}")
+        yield data
+
+    # One extra session is reserved so that search pages don't wait behind the details pages
+    with DriverPool(options, size=workers + 1, max_pages=max_pages) as driver_pool:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        finished = False
+        try:
+            fetcher = build_fetcher(backend, driver_pool, rate_limiter, pool_size=workers + 1)
+            for job_title, location in product(job_titles, locations):
+                query = query_key(job_title, location)
+                page_start = checkpoint.resume_start(query, start) if checkpoint is not None else start
+                # The query was finished before the crawl was interrupted
+                if page_start is None:
+                    continue
+
+                while budget_left():
+                    # Pass on the listings that are already done, keeping the order they were found in,
+                    # and wait for the oldest ones while too many are pending
+                    while pending and (pending[0].done() or len(pending) >= max_pending):
+                        yield from take_oldest()
+
+                    url = build_search_url(base_url, job_title, location, sort, page_start)
+                    job_listings = get_job_listings(url, fetcher)
+                    search_pages += 1
+
+                    new_listings = [job_listing for job_listing in job_listings if job_listing['Job ID'] not in seen_job_ids]
+                    print(f"Found {len(new_listings)} new job listings for '{job_title}' in '{location}' (start={page_start})")
+
+                    # The results have run out once a page has no listings we haven't seen yet
+                    if not new_listings:
+                        if checkpoint is not None:
+                            checkpoint.query_finished(query)
+                        break
+
+                    scheduled_ids = []
+                    for job_listing in new_listings:
+                        seen_job_ids.add(job_listing['Job ID'])
+                        # Postings scraped in earlier runs still count for the pagination, but their details aren't fetched again
+                        if seen_jobs is not None and job_listing['Job ID'] in seen_jobs:
+                            continue
+                        # Neither are the postings saved before the crawl was interrupted
+                        if checkpoint is not None and checkpoint.is_completed(job_listing['Job ID']):
+                            continue
+                        pending.append(executor.submit(get_job_data, job_listing, fetcher))
+                        scheduled_ids.append(job_listing['Job ID'])
+                    if checkpoint is not None:
+                        checkpoint.page_scheduled(query, page_start, scheduled_ids, page_start + page_size)
+                    page_start += page_size
+
+            # Wait for the rest of the listings
+            while pending:
+                # Listings that haven't been started when the time budget runs out are dropped
+                if deadline is not None and monotonic() >= deadline and pending[0].cancel():
+                    pending.popleft()
+                    continue
+                yield from take_oldest()
+            finished = True
+        finally:
+            # When the caller stops early (the generator is closed or saving failed), queued listings are cancelled
+            # and only the fetches already running are waited for
+            executor.shutdown(wait=True, cancel_futures=not finished)
+
+    print(f"Crawled {search_pages} search pages and {extracted} new job listings.")
+
+# Crawl all combinations of job titles and locations and save the listings to raw files of batch_size listings as they come in
+# Takes the same options as crawl_job_data
+# With skip_known, listings already in the seen jobs index (see seen_jobs.py) are not opened again
+# After each saved batch the crawl is checkpointed (see checkpoint.py), so a crawl that crashes or is preempted
+# resumes from its last saved batch when it is started again with the same queries
+@span('extract')
+def crawl(job_titles, locations, sort, base_url, skip_known=True, batch_size=50, **crawl_options):
+    seen_jobs = open_seen_jobs_index() if skip_known else None
+    checkpoint = CrawlCheckpoint(get_raw_storage(), run_key(job_titles, locations, sort, base_url,
+                                                            crawl_options.get('start', 0), crawl_options.get('page_size', 10)))
+
+    # Remember the saved listings so that a restarted crawl and the next runs skip them
+    def on_saved(job_ids):
+        if seen_jobs is not None:
+            seen_jobs.add(job_ids)
+        checkpoint.save(job_ids)
+
+    records = crawl_job_data(job_titles, locations, sort, base_url, seen_jobs=seen_jobs, checkpoint=checkpoint, **crawl_options)
+    save_raw_batches(records, batch_size, on_saved)
+
+    # The crawl has finished, so the next one starts from scratch
+    checkpoint.clear()
+    if seen_jobs is not None:
+        seen_jobs.close()
@@ -0,0 +1,104 @@
+# Driver_pool.py keeps a bounded pool of long-lived Chrome WebDriver sessions for extract.py
+# Starting Chrome is the slowest part of scraping a listing, so sessions are reused across pages
+# Each session is health-checked before use and recycled after a number of pages or after a crash
+
+import queue
+import threading
+from contextlib import contextmanager
+from metrics import timer
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+class DriverPool:
+    def __init__(self, options, size=1, max_pages=10):
+        self.options = options
+        self.max_pages = max_pages
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # Start a new Chrome session
+    def _start_driver(self):
+        with timer('chrome_start_seconds'):
+            driver = webdriver.Chrome(options=self.options)
+        with self._lock:
+            self._pages[id(driver)] = 0
+        return driver
+
+    # Quit a session and forget its page count, ignoring errors from an already crashed browser
+    def _quit_driver(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            print(f"Error quitting Chrome session: {e}")
+
+    # A session is healthy if the browser still answers and has an open window
+    def _is_healthy(self, driver):
+        try:
+            return len(driver.window_handles) > 0
+        except WebDriverException:
+            return False
+
+    # Take a healthy session from the pool, starting a new one if none is idle
+    # Blocks while all sessions of the pool are in use
+    def acquire(self):
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._start_driver()
+                if self._is_healthy(driver):
+                    return driver
+                self._quit_driver(driver)
+        except Exception:
+            self._slots.release()
+            raise
+
+    # Return a session to the pool after it has loaded a page
+    # Sessions that failed or have served max_pages pages are quit instead of reused
+    def release(self, driver, failed=False):
+        try:
+            with self._lock:
+                self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+                pages = self._pages[id(driver)]
+            if failed or self._closed or pages >= self.max_pages:
+                self._quit_driver(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    # Context manager that hands out a session and returns it to the pool afterwards
+    @contextmanager
+    def session(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, failed=True)
+            raise
+        self.release(driver)
+
+    # Quit all idle sessions, sessions still in use are quit when they are released
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit_driver(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -7,174 +7,113 @@ Setting up libraries and Chrome driver options
 
 # Import needed libraries
 import pandas as pd
-import random
-import re
-import os
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from bs4 import BeautifulSoup
+from config import get_base_url
 from datetime import datetime
+from fetchers import PageReady, USER_AGENT
+from formats import RAW_SCHEMA, serialize_frame
+from metrics import count, timer
+from parsing import parse_job_details, parse_job_listings
 from selenium import webdriver
-from time import sleep
+from staging_formats import file_extension, get_staging_format
+from storage import get_raw_storage
 
 # Set up Chrome options to mimic browser behavior
 options = webdriver.ChromeOptions()
-options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36')
+options.add_argument(f'user-agent={USER_AGENT}')
 options.add_argument("--disable-dev-shm-usage")
 options.add_argument("--no-sandbox")
 options.add_argument("--disable-gpu")
 options.add_argument("--disable-extensions")
 options.add_argument("--headless")
+# driver.get returns once the HTML has been parsed instead of after every image and script has loaded,
+# so the wait for the needed element (see fetchers.py) decides how long a page takes
+options.page_load_strategy = 'eager'
+
+# Columns of the raw data, in the order of the tuples returned by get_job_data
+RAW_COLUMNS = ['Job ID', 'Title', 'Company', 'Location', 'Salary', 'Job Type', 'Full Job Description']
+
+# What a page needs before it can be parsed: the element to wait for in Chrome and the marker to find in plain HTML
+SEARCH_PAGE_READY = PageReady('div.job_seen_beacon', 'job_seen_beacon')
+DETAILS_PAGE_READY = PageReady('#jobDescriptionText', 'jobDescriptionText')
 
 '''
 Functionality to extract the job listings data
 '''
 
 # Function to extract the wanted job listing data and write it to a pandas dataframe
-def get_job_data(job_listing, url):
-
-    # Iimportant! Initialize driver again to establish a new fresh connection for each listing --> otherwise, the run will fail after 2-3 listings
-    driver = webdriver.Chrome(options=options)
-
-    # Extract job_id and job title. These will always be present
-    job_id = job_listing.find("a")["id"]
-    title = job_listing.find("a").find("span").text.strip()
-    
-    # Extract company and location
-    try:
-        company = job_listing.find('span', class_='css-63koeb eu4oa1w0').text.strip()
-    except AttributeError:
-        company = None
-    
-    try:
-        location  = job_listing.find('div', class_='css-1p0sjhy eu4oa1w0').text.strip()
-    except AttributeError:
-        location = None
-
-    # Simulate clicking on the job to reveal additional details, like salary, job type, full job description
-    from config import get_base_url
-
-    job_link = job_listing.find('a')['href']
-    job_url = f"{get_base_url()}{job_link}"
-    driver.execute_script("window.open('{}')".format(job_url))
-    # Switch to the new tab (last handle)
-    driver.switch_to.window(driver.window_handles[-1])
-
-    # Wait for job details to load
-    sleep(random.uniform(1, 3))
-
-    # Get the opened job details page source and parse it
-    job_details_soup = BeautifulSoup(driver.page_source, "html.parser")
-
-    # Extract salary, job type, full job description from job details page
-    try:
-        salary = job_details_soup.find('span', class_="css-19j1a75 eu4oa1w0").text.strip()
-    except AttributeError:
-        salary = None
-    
-    try:
-        job_type = job_details_soup.find('span', class_='css-k5flys eu4oa1w0').text.strip()
-    except AttributeError:
-        job_type = None
-
-    try:
-        full_job_description = job_details_soup.find(id="jobDescriptionText", class_="jobsearch-JobComponent-description css-16y4thd eu4oa1w0").text
-        # Clean up whitespace while preserving paragraphs
-        paragraphs = re.split(r'\n\s*\n', full_job_description)
-        cleaned_paragraphs = [' '.join(p.split()) for p in paragraphs]
-        full_job_description = '\n\n'.join(cleaned_paragraphs)
-    except AttributeError:
-        full_job_description = None
-
-    try:
-        # Close the job details page
-        driver.close()
-        
-        # Check if there are any remaining window handles
-        if driver.window_handles:
-            # Switch back to the main page (first handle)
-            driver.switch_to.window(driver.window_handles[0])
-        else:
-            # If no handles left, reinitialize the driver and load the main page
-            driver.quit()
-            driver = webdriver.Chrome(options=options)
-            driver.get(url)
-            sleep(5)  # Allow time for the page to load
-    except Exception as e:
-        print(f"Error switching windows: {e}")
-        # In case of error, reinitialize the driver and load the main page
-        driver.quit()
-        driver = webdriver.Chrome(options=options)
-        driver.get(url)
-        sleep(5)  # Allow time for the page to load
-
-
-    # Random sleep after each listing
-    sleep(random.uniform(1, 3))
+# job_listing holds the fields read from the listing card, see parsing.py
+# The job details page is downloaded with the fetcher, which is shared by all workers
+# Returns None if the details page couldn't be fetched or has no job description, such a listing is not saved
+# nor marked as seen, so the next run tries it again
+def get_job_data(job_listing, fetcher):
+    # Open the job details page to reveal additional details, like salary, job type, full job description
+    job_url = f"{get_base_url()}{job_listing['Job Link']}"
+
+    # Get the job details page source once the job description is there and parse it
+    with timer('details_fetch_seconds'):
+        page_source = fetcher.fetch(job_url, DETAILS_PAGE_READY)
+    if page_source is None:
+        print(f"Could not fetch the details of job listing {job_listing['Job ID']}, it is tried again in the next run")
+        count('details_failed')
+        return None
+    with timer('details_parse_seconds'):
+        job_details = parse_job_details(page_source)
+    if job_details['Full Job Description'] is None:
+        print(f"No job description found for job listing {job_listing['Job ID']}, it is tried again in the next run")
+        count('details_failed')
+        return None
 
     # Return a tuple containing all the extracted information
-    return (job_id, title, company, location, salary, job_type, full_job_description)
-
-
-'''
-Main program that runs the scraper
-'''
-
-def extract_data(input_url):
-    # Initialize a Chrome webdriver with the specified options
-    driver = webdriver.Chrome(options=options)
-
-    # Define the URL to scrape and open URL in Chrome WebDriver instance
-    url = input_url
-    driver.get(url)
-
-    # Add sleep for 5s to allow the page to load
-    sleep(5)
-
-    # Get the main page source and parse it with BeautifulSoup
-    soup = BeautifulSoup(driver.page_source, "html.parser") 
-
-    # Find all job listings, i.e. divs with 'job_seen_beacon' -class
-    job_listings = soup.find_all('div', class_='job_seen_beacon')
-    job_data_list = []
-
-    # Loop over the job listings
-    for index, job_listing in enumerate(job_listings):
-        data = get_job_data(job_listing, url)
-        job_data_list.append(data)
-        print(f"Successfully extracted data for job listing {index + 1}")
-        # Add a longer sleep every 5 listings
-        if (index + 1) % 5 == 0:
-            sleep(random.uniform(5, 10))
-
+    return (job_listing['Job ID'], job_listing['Title'], job_listing['Company'], job_listing['Location'],
+            job_details['Salary'], job_details['Job Type'], job_details['Full Job Description'])
+
+# Function to open a search results page and find all job listings on it
+def get_job_listings(url, fetcher):
+    # Get the page source once the job listings are there and read the listing cards
+    with timer('search_fetch_seconds'):
+        page_source = fetcher.fetch(url, SEARCH_PAGE_READY)
+    with timer('search_parse_seconds'):
+        return parse_job_listings(page_source)
+
+# Function to save the extracted job data to a .csv-file (or .parquet-file, see formats.py) on Azure Blob Storage or on disk (see storage.py)
+# Files saved in micro-batches are numbered with part, as several of them can be saved within the same second
+def save_raw_data(job_data_list, part=None):
     # Convert list of records into a pandas dataframe
-    df = pd.DataFrame(job_data_list, columns=['Job ID', 'Title', 'Company', 'Location', 'Salary', 'Job Type', 'Full Job Description'])
+    df = pd.DataFrame(job_data_list, columns=RAW_COLUMNS)
 
-    # Define the container and file name
+    # Define the file name
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    CONTAINER_NAME = os.environ.get('AZURE_RAW_STORAGE_CONTAINER_NAME')
-    BLOB_NAME = f'data_eng_info_raw_{current_time}.csv'
-
-    # Set up Azure Key Vault client
-    key_vault_url = os.environ.get('AZURE_KEY_VAULT_URL')
-    credential = DefaultAzureCredential()
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    # Retrieve the connection string from Azure Key Vault
-    secret_name = os.environ.get('AZURE_STORAGE_CONNECTION_STRING_SECRET_NAME')
-    PASS_TOKEN = secret_client.get_secret(secret_name).value
-
-    # Create the BlobServiceClient using the retrieved connection string
-    BLOB_SERVICE_CLIENT = BlobServiceClient.from_connection_string(PASS_TOKEN)
-
-    # Create a blob client
-    blob_client = BLOB_SERVICE_CLIENT.get_blob_client(container=CONTAINER_NAME, blob=BLOB_NAME)
-
-    # Upload the DataFrame directly to Azure Blob Storage
-    csv_data = df.to_csv(sep=";", index=False).encode('utf-8')
-    blob_client.upload_blob(csv_data, overwrite=True)
-    print(f"Data uploaded to blob {BLOB_NAME} in container {CONTAINER_NAME}.")
-
-    # Close the Chrome WebDriver instance
-    driver.quit()
\ No newline at end of file
+    staging_format = get_staging_format()
+    part_suffix = f'_{part:04d}' if part is not None else ''
+    BLOB_NAME = f'data_eng_info_raw_{current_time}{part_suffix}{file_extension(staging_format)}'
+
+    # Write the DataFrame directly to the raw data storage
+    storage = get_raw_storage()
+    file_data = serialize_frame(df, staging_format, RAW_SCHEMA)
+    storage.write(BLOB_NAME, file_data)
+    print(f"Data saved to {BLOB_NAME} in {storage.location}.")
+
+# Save job data records as they come in, to raw files of at most batch_size records each
+# After each file is saved, on_saved is called with the job IDs in it, e.g. to update the seen jobs index and the crawl checkpoint
+# Returns the number of records saved
+def save_raw_batches(records, batch_size=50, on_saved=None):
+    batch = []
+    part = 0
+    saved = 0
+
+    def flush():
+        nonlocal part, saved
+        save_raw_data(batch, part)
+        if on_saved is not None:
+            on_saved([data[0] for data in batch])
+        part += 1
+        saved += len(batch)
+        batch.clear()
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return saved
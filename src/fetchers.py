@@ -0,0 +1,125 @@
+# Fetchers.py holds the backends that download pages for extract.py
+# HttpFetcher downloads pages over a pooled keep-alive HTTP session, which costs far less than a Chrome tab
+# SeleniumFetcher renders pages in pooled Chrome sessions and is used when the plain HTML lacks the expected markup
+
+import requests
+import threading
+from collections import namedtuple
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from time import monotonic
+
+# User agent shared by the HTTP session and the Chrome options
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36'
+
+# Tells when a page has what we need: a CSS selector to wait for in Chrome, and a marker to look for in the raw HTML
+PageReady = namedtuple('PageReady', ['css_selector', 'marker'])
+
+# Open a URL and wait until the element matching css_selector is present, at most timeout seconds
+# With the eager page load strategy (see extract.py) driver.get doesn't wait for the load event, so the element decides
+# The time it took is reported to the rate limiter, and a timeout (error page, captcha, empty page) counts as a failure
+# Returns the page source, or None if the element never appeared
+def load_page(driver, url, css_selector, rate_limiter, timeout=15):
+    rate_limiter.wait()
+    started = monotonic()
+    driver.get(url)
+    try:
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, css_selector)))
+        ready = True
+    except TimeoutException:
+        print(f"Timed out waiting for {css_selector} on {url}")
+        ready = False
+    rate_limiter.record(ready, monotonic() - started)
+    return driver.page_source if ready else None
+
+# Fetch pages by rendering them in Chrome sessions borrowed from a driver pool
+class SeleniumFetcher:
+    def __init__(self, driver_pool, rate_limiter, timeout=15, attempts=2):
+        self.driver_pool = driver_pool
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.attempts = attempts
+
+    # Return the rendered page source, or None if the page didn't load or Chrome crashed on every attempt
+    # A crashed session is recycled by the pool and the page is tried again on another session,
+    # a page that still fails is skipped so that one listing doesn't end the whole crawl
+    def fetch(self, url, ready):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with self.driver_pool.session() as driver:
+                    return load_page(driver, url, ready.css_selector, self.rate_limiter, self.timeout)
+            except WebDriverException as e:
+                print(f"Chrome session failed on {url} (attempt {attempt} of {self.attempts}): {e.msg}")
+        print(f"Skipping {url}")
+        return None
+
+# Fetch pages with plain HTTP requests over one shared session with a connection pool
+# As the probe in front of Chrome (penalize_missing_markup=False), a page without the markup isn't reported to the
+# rate limiter, as Chrome loads the same page right after and reports how the site responded
+class HttpFetcher:
+    def __init__(self, rate_limiter, pool_size=10, timeout=15, penalize_missing_markup=True):
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.penalize_missing_markup = penalize_missing_markup
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT, 'Accept-Language': 'en-US,en;q=0.9'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # Return the page source, or None if the response is an error or lacks the expected markup
+    def fetch(self, url, ready):
+        self.rate_limiter.wait()
+        started = monotonic()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"HTTP request failed for {url}: {e}")
+            self.rate_limiter.record(False, monotonic() - started)
+            return None
+
+        # Throttling, block pages and server errors slow down the crawl, and so does a page served with 200
+        # that lacks the expected markup, e.g. a captcha or an interstitial. Other responses count as answered.
+        has_markup = response.status_code == 200 and ready.marker in response.text
+        missing_markup = response.status_code == 200 and not has_markup
+        blocked = response.status_code in (403, 429) or response.status_code >= 500 or (missing_markup and self.penalize_missing_markup)
+        if self.penalize_missing_markup or not missing_markup:
+            self.rate_limiter.record(not blocked, monotonic() - started)
+        if not has_markup:
+            return None
+        return response.text
+
+# Try the primary fetcher first and use the fallback when the primary returns nothing
+# After max_misses misses in a row the primary is given up on, and the fallback fetches every page for the rest of the run
+class FallbackFetcher:
+    def __init__(self, primary, fallback, max_misses=3):
+        self.primary = primary
+        self.fallback = fallback
+        self.max_misses = max_misses
+        self.misses = 0
+        self.fallback_only = False
+        self._lock = threading.Lock()
+
+    def fetch(self, url, ready):
+        if not self.fallback_only:
+            page_source = self.primary.fetch(url, ready)
+            with self._lock:
+                self.misses = 0 if page_source is not None else self.misses + 1
+                if self.misses >= self.max_misses and not self.fallback_only:
+                    self.fallback_only = True
+                    print(f"Plain HTTP missed {self.misses} pages in a row, fetching the rest of the pages with Chrome")
+            if page_source is not None:
+                return page_source
+        return self.fallback.fetch(url, ready)
+
+# Build the fetcher for a backend: 'http' uses HTTP with Selenium as fallback, 'selenium' uses Chrome only
+def build_fetcher(backend, driver_pool, rate_limiter, pool_size=10):
+    selenium_fetcher = SeleniumFetcher(driver_pool, rate_limiter)
+    if backend == 'selenium':
+        return selenium_fetcher
+    if backend == 'http':
+        return FallbackFetcher(HttpFetcher(rate_limiter, pool_size=pool_size, penalize_missing_markup=False), selenium_fetcher)
+    raise ValueError(f"Unknown fetch backend: {backend}")
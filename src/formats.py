@@ -0,0 +1,67 @@
+# Formats.py reads and writes the staging files passed between extract, transform and load
+# Files are semicolon-delimited CSV by default, or Parquet with an explicit schema when PIPELINE_STAGING_FORMAT=parquet
+# Readers pick the format from the file extension, so a container may hold both while switching over
+
+import io
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Schema of the raw files written by extract.py
+RAW_SCHEMA = pa.schema([
+    ('Job ID', pa.string()),
+    ('Title', pa.string()),
+    ('Company', pa.string()),
+    ('Location', pa.string()),
+    ('Salary', pa.string()),
+    ('Job Type', pa.string()),
+    ('Full Job Description', pa.string()),
+])
+
+# Schema of the processed files written by transform.py, with nullable numerics and a native list of skills
+PROCESSED_SCHEMA = pa.schema([
+    ('Job ID', pa.string()),
+    ('Title', pa.string()),
+    ('Company', pa.string()),
+    ('Location', pa.string()),
+    ('Salary_Lower', pa.float64()),
+    ('Salary_Avg', pa.float64()),
+    ('Salary_Upper', pa.float64()),
+    ('Hourly_Rate_Lower', pa.float64()),
+    ('Hourly_Rate_Avg', pa.float64()),
+    ('Hourly_Rate_Upper', pa.float64()),
+    ('Job Type', pa.string()),
+    ('Req_Skills', pa.list_(pa.string())),
+])
+
+# Serialize a dataframe to bytes in the given format, Parquet files follow the given schema
+def serialize_frame(df, staging_format, schema):
+    if staging_format == 'csv':
+        return df.to_csv(sep=';', index=False).encode('utf-8')
+    buffer = io.BytesIO()
+    write_parquet(df, buffer, schema)
+    return buffer.getvalue()
+
+# Write a dataframe to a Parquet file object, compressed with zstd
+def write_parquet(df, file, schema):
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), file, compression='zstd')
+
+# Arrow gives missing strings as None, the rest of the pipeline expects NaN as read_csv gives them
+def to_pandas(table):
+    df = table.to_pandas()
+    return df.where(df.notna(), np.nan)
+
+# Read a staging file into a dataframe, reading only the given columns if any
+# data can be bytes or any other buffer, e.g. a memory-mapped file, it is read in place without being copied
+# dtype is passed on to read_csv, raw files are read with dtype=str so that a column without any value isn't read as numbers
+def read_frame(data, staging_format, columns=None, dtype=None):
+    if staging_format == 'csv':
+        return pd.read_csv(pa.BufferReader(data), sep=';', header=0, usecols=columns, dtype=dtype)
+    return to_pandas(pq.read_table(pa.BufferReader(data), columns=columns))
+
+# Read a Parquet file in dataframes of at most chunk_size rows
+def iter_parquet_chunks(data, chunk_size, columns=None):
+    parquet_file = pq.ParquetFile(pa.BufferReader(data))
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        yield to_pandas(pa.Table.from_batches([batch]))
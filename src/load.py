@@ -1,14 +1,18 @@
-# Load takes the processed .csv-files, does some final transformations and writes them into a PostgreSQL database on Azure.
+# Load takes the processed .csv- or .parquet-files, does some final transformations and writes them into a PostgreSQL database on Azure.
+# The files are read from Azure Blob Storage or from a local directory, see storage.py
 
+import ast
 import csv
-import os
 import psycopg2
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+import psycopg2.extensions
 from config import config
+from io import StringIO
+from metrics import count, span, timer
+from skill_tables import create_skill_tables, update_skill_tables
+from staging_formats import format_of
+from storage import get_processed_storage
 
-# Create the table and columns if it doesn't exist
+# Create the table and columns if it doesn't exist, along with the skill tables and rollups (see skill_tables.py)
 def create_table(cursor):
     cursor.execute("""CREATE TABLE IF NOT EXISTS jobs (
             job_id CHAR(32) PRIMARY KEY,
@@ -24,87 +28,170 @@ def create_table(cursor):
             job_type VARCHAR(255),
             req_skill VARCHAR(255)[]
     );""")
+    create_skill_tables(cursor)
+
+# Database cursor that counts its round trips, pass it as cursor_factory to psycopg2.connect
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        count('db_round_trips')
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        count('db_round_trips')
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        count('db_round_trips')
+        return super().copy_expert(sql, file, size)
+
+# Columns of the jobs table in insert order
+JOB_COLUMNS = ['job_id', 'title', 'company', 'location', 'salary_lower', 'salary_avg', 'salary_upper', 'hourly_rate_lower', 'hourly_rate_avg', 'hourly_rate_upper', 'job_type', 'req_skill']
+
+# Columns of the processed files that are loaded into the table
+LOAD_COLUMNS = ['Job ID', 'Title', 'Company', 'Location', 'Salary_Lower', 'Salary_Avg', 'Salary_Upper', 'Hourly_Rate_Lower', 'Hourly_Rate_Avg', 'Hourly_Rate_Upper', 'Job Type', 'Req_Skills']
+
+# The processed .csv-files store the skills as a stringified Python list, e.g. "['SQL', 'Python']"
+# Parse it as a literal instead of evaluating it as code, .parquet-files already have a native list
+def parse_skills(value):
+    if value is None or (isinstance(value, str) and not value):
+        return []
+    if isinstance(value, str):
+        value = ast.literal_eval(value)
+    return [skill.strip() for skill in value]
+
+# Empty values in .csv-files and missing values in .parquet-files are both inserted as nulls
+def empty_to_none(value):
+    return None if value == '' else value
+
+# Convert one processed row to a tuple of values in JOB_COLUMNS order
+def prepare_job_row(row):
+    # If the values are empty, insert nulls
+    salary_lower = empty_to_none(row['Salary_Lower'])
+    salary_avg = empty_to_none(row['Salary_Avg'])
+    salary_upper = empty_to_none(row['Salary_Upper'])
+    hourly_rate_lower = empty_to_none(row['Hourly_Rate_Lower'])
+    hourly_rate_avg = empty_to_none(row['Hourly_Rate_Avg'])
+    hourly_rate_upper = empty_to_none(row['Hourly_Rate_Upper'])
+    job_type = 'No info' if row['Job Type'] in ('nan', None) else row['Job Type']
+
+    return (row['Job ID'], row['Title'], row['Company'], row['Location'], salary_lower, salary_avg, salary_upper, hourly_rate_lower, hourly_rate_avg, hourly_rate_upper, job_type, parse_skills(row['Req_Skills']))
+
+# Insert or update jobs from the rows of a query, returns the statement
+# A job that is already in the table only gets its skills updated, e.g. when transform.py has matched them again
+# after the skills dictionary changed. Inserted jobs are recorded in new_jobs and jobs with changed skills in changed_jobs,
+# call update_skill_tables to bring the skill tables up to date with them
+def upsert_jobs_statement(rows_query):
+    return f"""
+        WITH upserted AS (
+            INSERT INTO jobs ({', '.join(JOB_COLUMNS)})
+            {rows_query}
+            ON CONFLICT (job_id) DO UPDATE SET req_skill = EXCLUDED.req_skill
+                WHERE jobs.req_skill IS DISTINCT FROM EXCLUDED.req_skill
+            RETURNING job_id, xmax = 0 AS inserted
+        ), inserted AS (
+            INSERT INTO new_jobs SELECT job_id FROM upserted WHERE inserted ON CONFLICT DO NOTHING
+        )
+        INSERT INTO changed_jobs SELECT job_id FROM upserted WHERE NOT inserted ON CONFLICT DO NOTHING
+    """
 
 # Insert the data into the table
 def insert_job_data(cursor, row):
-    # PostgreSQL requires the array to be of format {skill1, skill2, skill3}
-    skills_array = '{' + ', '.join(f'"{skill.strip()}"' for skill in eval(row['Req_Skills'])) + '}' 
+    # Psycopg2 adapts the Python list of skills to a PostgreSQL array
+    cursor.execute(upsert_jobs_statement(f"VALUES ({', '.join(['%s'] * len(JOB_COLUMNS))})"), prepare_job_row(row))
+    count('rows_loaded')
 
-    # If the values are empty, insert nulls
-    salary_lower = None if row['Salary_Lower'] == '' else row['Salary_Lower']
-    salary_avg = None if row['Salary_Avg'] == '' else row['Salary_Avg']
-    salary_upper = None if row['Salary_Upper'] == '' else row['Salary_Upper']
-    hourly_rate_lower = None if row['Hourly_Rate_Lower'] == '' else row['Hourly_Rate_Lower']
-    hourly_rate_avg = None if row['Hourly_Rate_Avg'] == '' else row['Hourly_Rate_Avg']
-    hourly_rate_upper = None if row['Hourly_Rate_Upper'] == '' else row['Hourly_Rate_Upper']
-    job_type = 'No info' if row['Job Type'] == 'nan' else row['Job Type']
-    
-    # Insert the data into the table
-    cursor.execute("""
-        INSERT INTO jobs (job_id, title, company, location, salary_lower, salary_avg, salary_upper, hourly_rate_lower, hourly_rate_avg, hourly_rate_upper, job_type, req_skill)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (job_id) DO NOTHING
-    """, (row['Job ID'], row['Title'], row['Company'], row['Location'], salary_lower, salary_avg, salary_upper, hourly_rate_lower, hourly_rate_avg, hourly_rate_upper, job_type, skills_array))
-
-# Clear the processed CSV files so that the staging area stays clean
-def clear_processed_files(blob_service_client, container_name):
-    print("Clearing processed CSV files from Azure Blob Storage...")
-    container_client = blob_service_client.get_container_client(container_name)
-    blobs_list = container_client.list_blobs()
-    
-    for blob in blobs_list:
-        if blob.name.endswith('.csv'):
-            try:
-                blob_client = container_client.get_blob_client(blob.name)
-                blob_client.delete_blob()
-                print(f"Deleted: {blob.name}")
-            except Exception as e:
-                print(f"Error deleting {blob.name}: {e}")
+# Escape a single value for the PostgreSQL COPY text format
+def copy_text_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, list):
+        # Array literal of format {"skill1","skill2"}, with quotes and backslashes escaped inside the elements
+        value = '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+# Bulk load rows into the table through a temporary staging table
+# The rows are streamed in with one COPY and moved to the jobs table with one set-based INSERT
+# The skill tables and rollups are then updated with the jobs that were new or got different skills
+@timer('db_bulk_load_seconds')
+def bulk_load_job_data(cursor, rows):
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS jobs_staging (LIKE jobs INCLUDING DEFAULTS);")
+    cursor.execute("TRUNCATE jobs_staging;")
+
+    buffer = StringIO()
+    row_count = 0
+    for row in rows:
+        buffer.write('\t'.join(copy_text_value(value) for value in prepare_job_row(row)) + '\n')
+        row_count += 1
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY jobs_staging ({', '.join(JOB_COLUMNS)}) FROM STDIN", buffer)
+
+    # A job can only be updated once per statement, so a job that is in the rows twice is taken once
+    cursor.execute(upsert_jobs_statement(f"SELECT DISTINCT ON (job_id) {', '.join(JOB_COLUMNS)} FROM jobs_staging ORDER BY job_id"))
+    update_skill_tables(cursor)
+    count('rows_loaded', row_count)
+
+# Read the rows of a processed file as dicts
+# .csv-files give strings, .parquet-files are read by column and give typed values with None for missing ones
+# blob_data can be bytes or a memory-mapped file
+# pandas and pyarrow are only imported when there is a .parquet-file to read
+def read_processed_rows(blob_data, staging_format):
+    if staging_format == 'csv':
+        return csv.DictReader(str(blob_data, 'utf-8').splitlines(), delimiter=";")
+    from formats import read_frame
+
+    return frame_to_rows(read_frame(blob_data, staging_format, columns=LOAD_COLUMNS))
+
+# Convert a processed dataframe to row dicts with None for missing values
+def frame_to_rows(df):
+    df = df[LOAD_COLUMNS].astype(object)
+    return df.where(df.notna(), None).to_dict('records')
+
+# Clear the processed files so that the staging area stays clean
+# On Azure Blob Storage the files are deleted with the batch delete API
+def clear_processed_files(storage, blob_names=None):
+    print(f"Clearing processed files from {storage.location}...")
+    if blob_names is None:
+        blob_names = [name for name in storage.list_files() if format_of(name) is not None]
+
+    failed = storage.delete(blob_names)
+    for blob_name in failed:
+        print(f"Error deleting {blob_name}")
+    print(f"Deleted {len(blob_names) - len(failed)} files.")
     
     print("Processed container cleared.")
 
 # The main function that loads the data into the database
-def load_data():
-    conn = psycopg2.connect(**config())
+# By default each file is bulk loaded with COPY, set bulk=False to insert row by row
+@span('load')
+def load_data(bulk=True):
+    conn = psycopg2.connect(**config(), cursor_factory=CountingCursor)
     cursor = conn.cursor()
 
     create_table(cursor)
     conn.commit()
 
-    # Set up Azure Key Vault client
-    key_vault_url = os.getenv('AZURE_KEY_VAULT_URL')
-    credential = DefaultAzureCredential()
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    # Retrieve the connection string from Azure Key Vault
-    secret_name = os.getenv('AZURE_STORAGE_CONNECTION_STRING_SECRET_NAME')
-    connection_string = secret_client.get_secret(secret_name).value
-
-    # Create the BlobServiceClient
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-
-    # Get a reference to the container
-    container_name = os.getenv('AZURE_PROCESSED_STORAGE_CONTAINER_NAME')
-    container_client = blob_service_client.get_container_client(container_name)
-
-    # List all blobs in the container
-    blob_list = container_client.list_blobs()
-
-    for blob in blob_list:
-        if blob.name.endswith('.csv'):
-            # Download the blob content
-            blob_client = container_client.get_blob_client(blob.name)
-            blob_data = blob_client.download_blob().readall().decode('utf-8')
-            
-            # Create a CSV reader from the blob data
-            reader = csv.DictReader(blob_data.splitlines(), delimiter=";")
-            
-            for row in reader:
+    # Get the processed data storage
+    storage = get_processed_storage()
+
+    # List all processed files in the storage
+    blob_names = [name for name in storage.list_files() if format_of(name) is not None]
+
+    # Download the files concurrently (or memory-map them from disk) while the already read ones are inserted
+    for blob_name, blob_data in storage.read_many(blob_names):
+        # Read the rows from the blob data
+        rows = read_processed_rows(blob_data, format_of(blob_name))
+        
+        if bulk:
+            bulk_load_job_data(cursor, rows)
+        else:
+            for row in rows:
                 insert_job_data(cursor, row)
+            update_skill_tables(cursor)
 
     conn.commit()
     conn.close()
 
     print("Wrote data to SQL table successfully!")
     
-    clear_processed_files(blob_service_client, container_name)
\ No newline at end of file
+    # Only the files that were loaded are deleted, files uploaded in the meantime are left for the next run
+    clear_processed_files(storage, blob_names)
\ No newline at end of file
@@ -1,33 +1,157 @@
 # Main.py is the entry point for the program
-# It executes the functions from extract.py, transform.py and load.py
+# It executes the functions from extract.py, transform.py and load.py, either all of them or one stage at a time:
+#   python main.py                                    runs the whole pipeline, same as python main.py run
+#   python main.py extract --workers 4 --batch-size 100
+#   python main.py transform --format parquet --full-refresh
+#   python main.py load
+# Run python main.py <stage> --help for all options, their defaults come from the environment variables used by cron
+# Each stage imports its modules only when it runs, so e.g. a load doesn't start up Selenium or the HTML parser
 
 # Import needed libraries and functions
-from extract import extract_data
-from transform import transform_data
-from load import load_data
-from config import get_job_title, get_location, get_sort, get_start, get_base_url
+import argparse
+import os
+import sys
+from metrics import write_run_report
 
-# URL parameters 
+COMMANDS = ('extract', 'transform', 'load', 'run')
+
+# Config values may be a single string or a list of strings
+def as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+# Optional numeric setting from an environment variable
+def env_number(name, number_type):
+    value = os.environ.get(name)
+    return number_type(value) if value else None
+
+# URL parameters
 # Modify config.py to search for different jobs and locations, alter sorting and where to start the scraping
-def main():
-    # Fetch parameters from config.py
-    job_title = get_job_title()
-    location = get_location()
+# get_job_title and get_location can return lists to crawl several queries and locations in one run
+def crawl_parameters():
+    from config import get_job_title, get_location, get_sort, get_start, get_base_url
+
+    job_titles = as_list(get_job_title())
+    locations = as_list(get_location())
     sort = get_sort()
-    start = get_start() # Note! If you want to start from first page, you need to omit &start={start} completely
+    start = int(get_start() or 0) # The first page is requested without &start= automatically
     base_url = get_base_url()
+    return job_titles, locations, sort, base_url, start
+
+# Crawl budget, fetch workers and fetch backend
+def crawl_options(args, start):
+    return {
+        'start': start,
+        'max_search_pages': args.max_search_pages,
+        'time_budget': args.time_budget,
+        'workers': args.workers,
+        'backend': args.backend,
+        'requests_per_second': args.requests_per_second,
+    }
+
+# Run the scraper over all result pages of every query and location
+def run_extract(args):
+    from crawl import crawl
+
+    job_titles, locations, sort, base_url, start = crawl_parameters()
+    crawl(job_titles, locations, sort, base_url, skip_known=args.skip_known, batch_size=args.batch_size,
+          **crawl_options(args, start))
+
+# Transform the raw data
+def run_transform(args):
+    from transform import transform_data
+
+    transform_data(full_refresh=args.full_refresh, chunk_size=args.chunk_size)
+
+# Load the transformed data into the database
+def run_load(args):
+    from load import load_data
+
+    load_data(bulk=not args.row_by_row)
+
+# Run all stages, one after the other or as one streaming pipeline without staging files in between
+def run_all(args):
+    if args.stream:
+        from pipeline import run_streaming_pipeline
+
+        job_titles, locations, sort, base_url, start = crawl_parameters()
+        run_streaming_pipeline(job_titles, locations, sort, base_url, batch_size=args.stream_batch_size,
+                               skip_known=args.skip_known, **crawl_options(args, start))
+    else:
+        run_extract(args)
+        run_transform(args)
+        run_load(args)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scrape job listings, transform them and load them into PostgreSQL.")
+    subparsers = parser.add_subparsers(dest='command', metavar='{extract,transform,load,run}')
+
+    # Where the staging files are kept and in which format, these are passed on to storage.py and formats.py
+    storage_options = argparse.ArgumentParser(add_help=False)
+    storage_options.add_argument('--format', choices=['csv', 'parquet'], help="staging file format (PIPELINE_STAGING_FORMAT, default csv)")
+    storage_options.add_argument('--storage', choices=['azure', 'local'], help="storage backend of the staging files (PIPELINE_STORAGE_BACKEND, default azure)")
+    storage_options.add_argument('--local-dir', help="directory of the local storage backend (PIPELINE_LOCAL_STORAGE_DIR)")
+
+    extract_options = argparse.ArgumentParser(add_help=False)
+    extract_options.add_argument('--workers', type=int, default=int(os.environ.get('EXTRACT_WORKERS', 1)), help="fetch workers (EXTRACT_WORKERS, default 1)")
+    extract_options.add_argument('--batch-size', type=int, default=int(os.environ.get('EXTRACT_BATCH_SIZE', 50)),
+                                 help="listings per raw file and crawl checkpoint (EXTRACT_BATCH_SIZE, default 50)")
+    extract_options.add_argument('--max-search-pages', type=int, default=env_number('CRAWL_MAX_SEARCH_PAGES', int),
+                                 help="results pages over the whole crawl (CRAWL_MAX_SEARCH_PAGES)")
+    extract_options.add_argument('--time-budget', type=float, default=env_number('CRAWL_TIME_BUDGET_SECONDS', float),
+                                 help="seconds the crawl may take (CRAWL_TIME_BUDGET_SECONDS)")
+    extract_options.add_argument('--backend', choices=['http', 'selenium'], default='http', help="how pages are fetched (default http)")
+    extract_options.add_argument('--requests-per-second', type=float, default=0.5, help="starting request rate (default 0.5)")
+    extract_options.add_argument('--no-skip-known', dest='skip_known', action='store_false', help="open listings seen in earlier runs again")
+
+    transform_options = argparse.ArgumentParser(add_help=False)
+    transform_options.add_argument('--full-refresh', action='store_true', help="transform all raw files, not only new ones")
+    transform_options.add_argument('--chunk-size', type=int, help="transform the raw files in chunks of this many rows")
+
+    load_options = argparse.ArgumentParser(add_help=False)
+    load_options.add_argument('--row-by-row', action='store_true', help="insert rows one by one instead of bulk loading them")
+
+    subparsers.add_parser('extract', parents=[storage_options, extract_options],
+                          help="scrape job listings into raw files").set_defaults(handler=run_extract)
+    subparsers.add_parser('transform', parents=[storage_options, transform_options],
+                          help="clean and skill-match the raw files").set_defaults(handler=run_transform)
+    subparsers.add_parser('load', parents=[storage_options, load_options],
+                          help="load the processed files into PostgreSQL").set_defaults(handler=run_load)
+    run_parser = subparsers.add_parser('run', parents=[storage_options, extract_options, transform_options, load_options],
+                                       help="run all stages (default)")
+    run_parser.add_argument('--stream', action='store_true', default=os.environ.get('PIPELINE_MODE', 'batch') == 'stream',
+                            help="run the stages as one streaming pipeline (PIPELINE_MODE=stream)")
+    run_parser.add_argument('--stream-batch-size', type=int, default=20, help="listings per micro-batch of the streaming pipeline (default 20)")
+    run_parser.set_defaults(handler=run_all)
+    return parser
 
-    # Run the scraper
-    extract_data(f"{base_url}/jobs?q=\"{job_title}\"&l=\"{location}\"&sort={sort}&start={start}")
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Without a stage, e.g. from cron, the whole pipeline runs
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv = ['run'] + argv
+    args = build_parser().parse_args(argv)
 
-    # Transform the raw data
-    transform_data()
+    # The stages read these settings from the environment when they run
+    if args.format:
+        os.environ['PIPELINE_STAGING_FORMAT'] = args.format
+    if args.storage:
+        os.environ['PIPELINE_STORAGE_BACKEND'] = args.storage
+    if args.local_dir:
+        os.environ['PIPELINE_LOCAL_STORAGE_DIR'] = args.local_dir
 
-    # Load the transformed data into the database
-    load_data()
+    # The run report (see metrics.py) is written also when a stage fails
+    try:
+        args.handler(args)
+    except BaseException:
+        write_run_report('error')
+        raise
+    write_run_report()
 
     # Print out a message to confirm that the process is complete
-    print("Data pipeline has been executed successfully!")
+    if args.command == 'run':
+        print("Data pipeline has been executed successfully!")
+    else:
+        print(f"The {args.command} stage has been executed successfully!")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,170 @@
+# Metrics.py records where the time of a pipeline run goes
+# Stages are timed as spans, repeated operations like page fetches, skill matching and bulk loads go into latency histograms,
+# and counters keep track of rows, bytes and database round trips. Each span reports the counters' growth while it ran.
+# Only the standard library is used, so every stage can import it without slowing down its startup
+# main.py writes a JSON run report at the end of each run (METRICS_REPORT_DIR) and,
+# if METRICS_PROMETHEUS_TEXTFILE is set, a textfile for the node exporter's textfile collector
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import monotonic, time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Default directory of the JSON run reports, next to the scripts
+DEFAULT_REPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'run_reports')
+
+# Upper bounds of the latency histogram buckets in seconds
+HISTOGRAM_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Prefix of the Prometheus metric names
+METRIC_PREFIX = 'jobs_pipeline'
+
+_lock = threading.Lock()
+_started_at = time()
+_start = monotonic()
+_spans = []
+_counters = {}
+_histograms = {}
+
+# Peak resident memory of the process so far in bytes, None where it can't be read
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Add to a counter, e.g. count('rows_loaded', len(rows))
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+# Record one observation of a latency histogram
+def observe(name, seconds):
+    with _lock:
+        _histograms.setdefault(name, []).append(seconds)
+
+# Time a block into a latency histogram
+@contextmanager
+def timer(name):
+    start = monotonic()
+    try:
+        yield
+    finally:
+        observe(name, monotonic() - start)
+
+# Time a pipeline stage, also usable as a function decorator: @span('transform')
+# The span records how much each counter grew while it ran and the peak memory when it ended
+@contextmanager
+def span(name):
+    with _lock:
+        counters_before = dict(_counters)
+    start = monotonic()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = monotonic() - start
+        with _lock:
+            counters = {counter: value - counters_before.get(counter, 0) for counter, value in _counters.items()
+                        if value != counters_before.get(counter, 0)}
+            _spans.append({
+                'name': name,
+                'start_offset_seconds': round(start - _start, 3),
+                'seconds': round(seconds, 3),
+                'status': status,
+                'counters': counters,
+                'per_second': {counter: round(value / seconds, 1) for counter, value in counters.items()
+                               if seconds > 0 and counter.startswith(('rows_', 'bytes_'))},
+                'peak_memory_bytes': peak_memory_bytes(),
+            })
+
+# Nearest-rank percentile of sorted values
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+# Summary of a latency histogram for the JSON report
+def summarize_histogram(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'sum_seconds': round(sum(values), 3),
+        'p50_seconds': round(percentile(values, 0.5), 4),
+        'p95_seconds': round(percentile(values, 0.95), 4),
+        'max_seconds': round(values[-1], 4),
+        'buckets': {str(bound): sum(1 for value in values if value <= bound) for bound in HISTOGRAM_BUCKETS},
+    }
+
+# The run so far as a dict
+def run_report(status='ok'):
+    with _lock:
+        return {
+            'started_at': datetime.fromtimestamp(_started_at).isoformat(timespec='seconds'),
+            'seconds': round(monotonic() - _start, 3),
+            'status': status,
+            'peak_memory_bytes': peak_memory_bytes(),
+            'spans': list(_spans),
+            'counters': dict(_counters),
+            'histograms': {name: summarize_histogram(values) for name, values in _histograms.items()},
+        }
+
+# The run in the Prometheus text exposition format
+def prometheus_text(report):
+    lines = [f'# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge',
+             f'{METRIC_PREFIX}_last_run_timestamp_seconds {_started_at:.0f}',
+             f'# TYPE {METRIC_PREFIX}_last_run_success gauge',
+             f'{METRIC_PREFIX}_last_run_success {int(report["status"] == "ok")}',
+             f'# TYPE {METRIC_PREFIX}_run_duration_seconds gauge',
+             f'{METRIC_PREFIX}_run_duration_seconds {report["seconds"]}']
+    if report['peak_memory_bytes'] is not None:
+        lines += [f'# TYPE {METRIC_PREFIX}_peak_memory_bytes gauge', f'{METRIC_PREFIX}_peak_memory_bytes {report["peak_memory_bytes"]}']
+
+    # Stages that ran more than once (e.g. several loads) are added up
+    stage_seconds = {}
+    for stage in report['spans']:
+        stage_seconds[stage['name']] = stage_seconds.get(stage['name'], 0) + stage['seconds']
+    lines.append(f'# TYPE {METRIC_PREFIX}_stage_duration_seconds gauge')
+    lines += [f'{METRIC_PREFIX}_stage_duration_seconds{{stage="{name}"}} {seconds}' for name, seconds in stage_seconds.items()]
+
+    # Counters start from zero in every run, so they are exported as gauges of the last run
+    for name, value in report['counters'].items():
+        lines += [f'# TYPE {METRIC_PREFIX}_{name} gauge', f'{METRIC_PREFIX}_{name} {value}']
+
+    with _lock:
+        histograms = {name: list(values) for name, values in _histograms.items()}
+    for name, values in histograms.items():
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} histogram')
+        for bound in HISTOGRAM_BUCKETS:
+            lines.append(f'{METRIC_PREFIX}_{name}_bucket{{le="{bound}"}} {sum(1 for value in values if value <= bound)}')
+        lines += [f'{METRIC_PREFIX}_{name}_bucket{{le="+Inf"}} {len(values)}',
+                  f'{METRIC_PREFIX}_{name}_sum {sum(values)}',
+                  f'{METRIC_PREFIX}_{name}_count {len(values)}']
+    return '\n'.join(lines) + '\n'
+
+# Write the JSON run report, and the Prometheus textfile if METRICS_PROMETHEUS_TEXTFILE is set
+# The textfile is written under a temporary name and renamed, so the node exporter never reads half a file
+def write_run_report(status='ok'):
+    report = run_report(status)
+
+    report_dir = os.environ.get('METRICS_REPORT_DIR', DEFAULT_REPORT_DIR)
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"run_{datetime.fromtimestamp(_started_at).strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Run report written to {report_path}")
+
+    textfile = os.environ.get('METRICS_PROMETHEUS_TEXTFILE')
+    if textfile:
+        with open(f'{textfile}.tmp', 'w') as file:
+            file.write(prometheus_text(report))
+        os.replace(f'{textfile}.tmp', textfile)
+    return report
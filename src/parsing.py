@@ -0,0 +1,67 @@
+# Parsing.py reads the job data out of search results pages and job details pages
+# Pages are parsed with lxml and only the nodes named in the field specs below are read
+# If the job site changes its markup, the field specs are the one place to update
+
+import re
+from collections import namedtuple
+from lxml import html as lxml_html
+
+# A field is read with an XPath expression relative to its container, either as stripped text,
+# as description text with its paragraphs preserved, or as the raw value of an attribute
+FieldSpec = namedtuple('FieldSpec', ['xpath', 'kind'])
+
+# Job listing cards on a search results page, i.e. divs with 'job_seen_beacon' -class
+LISTING_CARD_XPATH = "//div[contains(concat(' ', normalize-space(@class), ' '), ' job_seen_beacon ')]"
+
+# Fields read from each job listing card
+LISTING_FIELDS = {
+    'Job ID': FieldSpec('(.//a)[1]/@id', 'attribute'),
+    'Job Link': FieldSpec('(.//a)[1]/@href', 'attribute'),
+    'Title': FieldSpec('(.//a)[1]//span', 'text'),
+    'Company': FieldSpec(".//span[@class='css-63koeb eu4oa1w0']", 'text'),
+    'Location': FieldSpec(".//div[@class='css-1p0sjhy eu4oa1w0']", 'text'),
+}
+
+# Fields read from a job details page
+DETAILS_FIELDS = {
+    'Salary': FieldSpec("//span[@class='css-19j1a75 eu4oa1w0']", 'text'),
+    'Job Type': FieldSpec("//span[@class='css-k5flys eu4oa1w0']", 'text'),
+    'Full Job Description': FieldSpec("//*[@id='jobDescriptionText'][@class='jobsearch-JobComponent-description css-16y4thd eu4oa1w0']", 'paragraphs'),
+}
+
+# Clean up whitespace while preserving paragraphs
+def clean_paragraphs(text):
+    paragraphs = re.split(r'\n\s*\n', text)
+    return '\n\n'.join(' '.join(p.split()) for p in paragraphs)
+
+# Read one field from a parsed element, missing fields are None
+def read_field(element, spec):
+    matches = element.xpath(spec.xpath)
+    if not matches:
+        return None
+    if spec.kind == 'attribute':
+        return str(matches[0])
+    text = matches[0].text_content()
+    if spec.kind == 'paragraphs':
+        return clean_paragraphs(text)
+    return text.strip()
+
+# Parse a page source into an lxml tree, an empty page gives None
+def parse_page(page_source):
+    if not page_source or not page_source.strip():
+        return None
+    return lxml_html.fromstring(page_source)
+
+# Find all job listing cards on a search results page and read their fields into dicts
+def parse_job_listings(page_source):
+    tree = parse_page(page_source)
+    if tree is None:
+        return []
+    return [{name: read_field(card, spec) for name, spec in LISTING_FIELDS.items()} for card in tree.xpath(LISTING_CARD_XPATH)]
+
+# Read the salary, job type and full job description from a job details page
+def parse_job_details(page_source):
+    tree = parse_page(page_source)
+    if tree is None:
+        return {name: None for name in DETAILS_FIELDS}
+    return {name: read_field(tree, spec) for name, spec in DETAILS_FIELDS.items()}
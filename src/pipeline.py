@@ -0,0 +1,169 @@
+# Pipeline.py runs extract, transform and load as one streaming pipeline inside a single process
+# Scraped listings flow through bounded queues: they are cleaned and skill-matched in micro-batches and bulk loaded
+# into PostgreSQL batch by batch, so rows reach the database seconds after they are scraped
+# The raw and processed files are not staged in between, only an optional archive of the raw data is written (see storage.py)
+# If any stage fails, the others are stopped and their threads joined before the error is raised, so no Chrome session is left behind
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import queue
+import threading
+from config import config
+from contextlib import closing
+from crawl import crawl_job_data
+from extract import RAW_COLUMNS, save_raw_batches
+from load import CountingCursor, bulk_load_job_data, create_table, frame_to_rows
+from metrics import span
+from seen_jobs import open_seen_jobs_index
+from time import monotonic
+from transform import clean_data, process_data
+
+# Marks the end of a queue
+END = object()
+
+# How often a stage waiting on a queue checks whether the pipeline is stopping, in seconds
+POLL_INTERVAL = 0.5
+
+# Put an item on a queue, waiting while it is full until stop is set
+# Returns whether the item was put
+def put_until_stopped(target, item, stop):
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# Get an item from a queue, END once stop is set
+def get_until_stopped(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return END
+
+# Collect items from a queue into batches of at most batch_size items
+# A batch is also passed on once its first item has waited batch_timeout seconds, so slow scraping doesn't hold rows back
+# Ends without passing on the last batch once stop is set
+def micro_batches(source, batch_size, batch_timeout, stop):
+    batch = []
+    deadline = None
+    while not stop.is_set():
+        timeout = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0, deadline - monotonic()))
+        try:
+            item = source.get(timeout=timeout)
+        except queue.Empty:
+            if deadline is not None and monotonic() >= deadline:
+                yield batch
+                batch, deadline = [], None
+            continue
+
+        if item is END:
+            if batch:
+                yield batch
+            return
+
+        batch.append(item)
+        if deadline is None:
+            deadline = monotonic() + batch_timeout
+        if len(batch) >= batch_size:
+            yield batch
+            batch, deadline = [], None
+
+# Run a pipeline stage in a background thread, passing any error on to the main thread
+# An error stops the other stages. Otherwise the stage ends its output queue, so the next stage doesn't wait forever
+def start_stage(target, output_queue, errors, stop):
+    def run():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put_until_stopped(output_queue, END, stop)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+# Run the streaming pipeline for all combinations of job titles and locations
+# batch_size and batch_timeout set the micro-batches, queue_size bounds how far the scraper can run ahead of the rest
+# With archive_raw, the raw data of the loaded listings is archived to the raw data storage in files of batch_size listings
+# Other options are passed on to crawl.crawl_job_data
+@span('pipeline')
+def run_streaming_pipeline(job_titles, locations, sort, base_url, batch_size=20, batch_timeout=30, queue_size=100,
+                           archive_raw=True, skip_known=True, **crawl_options):
+    raw_queue = queue.Queue(maxsize=queue_size)
+    processed_queue = queue.Queue(maxsize=max(1, queue_size // batch_size))
+    errors = []
+    stop = threading.Event()
+    seen_jobs = open_seen_jobs_index() if skip_known else None
+
+    # Scrape the listings into the raw queue
+    # Closing the crawl generator ends its Chrome sessions also when the pipeline stops early
+    def extract_stage():
+        with closing(crawl_job_data(job_titles, locations, sort, base_url, seen_jobs=seen_jobs, **crawl_options)) as records:
+            for record in records:
+                if not put_until_stopped(raw_queue, record, stop):
+                    return
+
+    # Clean and skill-match the raw records in micro-batches
+    def transform_stage():
+        for batch in micro_batches(raw_queue, batch_size, batch_timeout, stop):
+            df = pd.DataFrame(batch, columns=RAW_COLUMNS)
+            # Missing values as NaN, the way read_csv gives them in the batch pipeline
+            df = df.where(df.notna(), np.nan)
+            if not put_until_stopped(processed_queue, (batch, process_data(clean_data(df))), stop):
+                return
+
+    threads = [start_stage(extract_stage, raw_queue, errors, stop),
+               start_stage(transform_stage, processed_queue, errors, stop)]
+
+    conn = psycopg2.connect(**config(), cursor_factory=CountingCursor)
+    cursor = conn.cursor()
+    create_table(cursor)
+    conn.commit()
+
+    loaded = 0
+
+    # Bulk load each processed batch into the database in the main thread, yielding the raw records of the loaded batches
+    def load_stage():
+        nonlocal loaded
+        while (item := get_until_stopped(processed_queue, stop)) is not END:
+            raw_batch, df = item
+            bulk_load_job_data(cursor, frame_to_rows(df))
+            conn.commit()
+
+            # Remember the loaded listings so that the next run skips them
+            if seen_jobs is not None:
+                seen_jobs.add(record[0] for record in raw_batch)
+            loaded += len(df)
+            print(f"Loaded {len(df)} job listings into the database ({loaded} in total)")
+            yield from raw_batch
+
+    try:
+        if archive_raw:
+            # The raw data is archived as it is loaded, so a failure loses at most the archive file being filled
+            save_raw_batches(load_stage(), batch_size=batch_size)
+        else:
+            for _ in load_stage():
+                pass
+    finally:
+        # Stop the other stages, e.g. when loading failed, and wait until they have ended before cleaning up
+        stop.set()
+        for pipeline_queue in (raw_queue, processed_queue):
+            while not pipeline_queue.empty():
+                pipeline_queue.get_nowait()
+        for thread in threads:
+            thread.join()
+        conn.close()
+        if seen_jobs is not None:
+            seen_jobs.close()
+
+    if errors:
+        raise errors[0]
+
+    print(f"Streaming pipeline loaded {loaded} job listings.")
@@ -0,0 +1,85 @@
+# Seen_jobs.py keeps a local index of job IDs that have already been scraped
+# The scraper checks the listing cards against it and skips the details pages of known postings
+# The index is an SQLite file on disk, and it can be seeded from the job IDs already in the database
+
+import os
+import psycopg2
+import sqlite3
+import threading
+from config import config
+
+# Default location of the index file, next to the scripts
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seen_jobs.sqlite')
+
+# Job IDs are stored the way the jobs table has them, i.e. without the 'job_' prefix of the listing cards
+def normalize_job_id(job_id):
+    job_id = job_id.strip()
+    return job_id[len('job_'):] if job_id.startswith('job_') else job_id
+
+class SeenJobsIndex:
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SEEN_JOBS_INDEX_PATH', DEFAULT_INDEX_PATH)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen_jobs (job_id TEXT PRIMARY KEY)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen_jobs").fetchone()[0]
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM seen_jobs WHERE job_id = ?", (normalize_job_id(job_id),)).fetchone() is not None
+
+    # Add job IDs to the index
+    def add(self, job_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO seen_jobs (job_id) VALUES (?)", ((normalize_job_id(job_id),) for job_id in job_ids))
+
+    # Seed the index with the job IDs already in the jobs table
+    def seed_from_database(self, cursor):
+        cursor.execute("SELECT job_id FROM jobs")
+        self.add(job_id for (job_id,) in cursor)
+
+    # Whether the index has been seeded from the database, also when the jobs table had no rows yet
+    @property
+    def seeded(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM index_meta WHERE key = 'seeded'").fetchone() is not None
+
+    def mark_seeded(self):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('seeded', datetime('now'))")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Open the index, seeding it from the database the first time it is used (e.g. on a new VM)
+# Seeding is best effort: if the database can't be reached the crawl goes on with the index as it is,
+# and the seeding is tried again in the next run
+def open_seen_jobs_index(path=None):
+    index = SeenJobsIndex(path)
+    if not index.seeded and len(index) == 0:
+        try:
+            conn = psycopg2.connect(**config())
+        except psycopg2.OperationalError as e:
+            print(f"Could not seed the seen jobs index from the database, continuing without it: {e}")
+            return index
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('jobs')")
+                if cursor.fetchone()[0] is not None:
+                    index.seed_from_database(cursor)
+        finally:
+            conn.close()
+        index.mark_seeded()
+        print(f"Seeded the seen jobs index with {len(index)} job IDs from the database.")
+    return index
@@ -0,0 +1,94 @@
+# Skill_cache.py remembers the skills found in each job description across runs
+# Reposted and duplicated postings have byte-identical descriptions, so each distinct description is matched only once
+# The cache is an SQLite file on disk keyed by a hash of the description and the version of the skills dictionary,
+# entries of an older skills dictionary are dropped as soon as the cache is opened with a new one
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from skill_matcher import get_skill_matcher, skills_version
+
+# Default location of the cache file, next to the scripts
+# Set SKILL_CACHE_PATH to an empty value to match every description without the cache
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skill_cache.sqlite')
+
+# SQLite limits the number of parameters in one query
+LOOKUP_BATCH_SIZE = 500
+
+# Content hash of a description
+def description_hash(description):
+    return hashlib.blake2b(description.encode('utf-8'), digest_size=16).hexdigest()
+
+class SkillCache:
+    def __init__(self, version, path=None):
+        self.version = version
+        self.path = path or os.environ.get('SKILL_CACHE_PATH', DEFAULT_CACHE_PATH)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS skill_cache (
+                description_hash TEXT PRIMARY KEY,
+                skills_version TEXT NOT NULL,
+                skills TEXT NOT NULL
+            ) WITHOUT ROWID""")
+            self._conn.execute("DELETE FROM skill_cache WHERE skills_version != ?", (version,))
+
+    # Cached skills of the given description hashes, hashes that aren't cached are left out
+    def get_many(self, hashes):
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                rows = self._conn.execute(f"""
+                    SELECT description_hash, skills FROM skill_cache
+                    WHERE skills_version = ? AND description_hash IN ({', '.join(['?'] * len(batch))})
+                """, [self.version] + batch)
+                found.update((hash_, json.loads(skills)) for hash_, skills in rows)
+        return found
+
+    # Add (description hash, skills) pairs to the cache
+    def put_many(self, items):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO skill_cache (description_hash, skills_version, skills) VALUES (?, ?, ?)",
+                                   ((hash_, self.version, json.dumps(skills)) for hash_, skills in items))
+
+    def close(self):
+        self._conn.close()
+
+# Caches are opened once per skills dictionary and reused
+_caches = {}
+_caches_lock = threading.Lock()
+
+# The cache for a skills dictionary, None if the cache is turned off
+def get_skill_cache(skills_dict):
+    if not os.environ.get('SKILL_CACHE_PATH', DEFAULT_CACHE_PATH):
+        return None
+    with _caches_lock:
+        cache = _caches.get(id(skills_dict))
+        if cache is None:
+            cache = SkillCache(skills_version(skills_dict))
+            _caches[id(skills_dict)] = cache
+        return cache
+
+# Find the skills for a pandas Series of descriptions
+# Each distinct description is matched once, and descriptions matched in an earlier run are read from the cache
+def match_series_cached(descriptions, skills_dict):
+    matcher = get_skill_matcher(skills_dict)
+    cache = get_skill_cache(skills_dict)
+
+    descriptions = descriptions.fillna('').astype('str')
+    hashes = [description_hash(description) for description in descriptions]
+    found = cache.get_many(set(hashes)) if cache is not None else {}
+
+    new_skills = {}
+    for hash_, description in zip(hashes, descriptions):
+        if hash_ not in found and hash_ not in new_skills:
+            new_skills[hash_] = matcher.match(description)
+    if cache is not None and new_skills:
+        cache.put_many(new_skills.items())
+
+    found.update(new_skills)
+    return [list(found[hash_]) for hash_ in hashes]
@@ -0,0 +1,97 @@
+# Skill_matcher.py finds the skills and technologies mentioned in job descriptions
+# The whole skills dictionary is compiled into one regular expression, so each description is scanned only once
+# The variations are factored into a trie, so at each word the regex follows one branch per character instead of
+# trying every variation in turn
+
+import hashlib
+import json
+import re
+
+# Bump whenever SkillMatcher matches differently, e.g. a change to the regular expression or the word boundaries,
+# so that the skills cached and loaded with the old matching are matched again
+MATCHER_VERSION = 1
+
+# R needs its own variations, since otherwise the single letter 'R' would match inside other words
+R_VARIATIONS = ['R', 'R programming', 'R language', 'R studio']
+
+# Regular expression matching any of the words, factored into a trie: 'spark', 'sql' and 'spark sql' --> s(?:park(?: sql)?|ql)
+# A variation that ends where a longer one goes on makes the rest optional, tried greedily so the longest match comes first
+def trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return build(trie)
+
+class SkillMatcher:
+    def __init__(self, skills_dict):
+        # Canonical skill names in output order: R first, then the order of the skills dictionary
+        self.skill_order = {'R': 0}
+        for skill in skills_dict:
+            self.skill_order.setdefault(skill, len(self.skill_order))
+
+        # Map each lowercased variation to the canonical skills it stands for
+        # Shared aliases map to several skills, e.g. 'mongodb' --> MongoDB and NoSQL
+        variation_skills = {}
+        for skill, variations in [('R', R_VARIATIONS)] + list(skills_dict.items()):
+            for variation in variations:
+                variation_skills.setdefault(variation.lower(), set()).add(skill)
+
+        # Only the longest variation is matched at each position, so a long variation also carries
+        # the skills of any shorter variation found inside it, e.g. 'microsoft azure synapse analytics' --> Azure
+        self.variation_skills = {}
+        for variation in variation_skills:
+            skills = set()
+            for other, other_skills in variation_skills.items():
+                if re.search(r'(?<!\w)' + re.escape(other) + r'(?!\w)', variation):
+                    skills |= other_skills
+            self.variation_skills[variation] = skills
+
+        # All variations as one trie, matched only on whole words, the longest variation at each position wins
+        # The lookahead keeps the match zero-width, so variations starting inside an earlier match are also found
+        self.pattern = re.compile(r'(?<!\w)(?=(' + trie_pattern(self.variation_skills) + r')(?!\w))')
+
+    # Find all skills in one lowercased description
+    def match_lower(self, description_lower):
+        found_skills = set()
+        for variation in self.pattern.findall(description_lower):
+            found_skills |= self.variation_skills[variation]
+        return sorted(found_skills, key=self.skill_order.get)
+
+    # Find all skills in one description
+    def match(self, description):
+        return self.match_lower(description.lower())
+
+    # Find the skills for a whole pandas Series of descriptions, lowercasing them in batches
+    def match_series(self, descriptions, batch_size=1000):
+        results = []
+        for start in range(0, len(descriptions), batch_size):
+            batch = descriptions.iloc[start:start + batch_size].fillna('').astype('str').str.lower()
+            results.extend(self.match_lower(description) for description in batch)
+        return results
+
+# Matchers are compiled once per skills dictionary and reused
+_matchers = {}
+
+def get_skill_matcher(skills_dict):
+    matcher = _matchers.get(id(skills_dict))
+    if matcher is None:
+        matcher = SkillMatcher(skills_dict)
+        _matchers[id(skills_dict)] = matcher
+    return matcher
+
+# Version hash of a skills dictionary, changes whenever a skill or a variation is added, removed or edited,
+# or when the matching itself changes (see MATCHER_VERSION)
+def skills_version(skills_dict):
+    skills_json = json.dumps({'matcher': MATCHER_VERSION, 'R': R_VARIATIONS, 'skills': skills_dict}, sort_keys=True)
+    return hashlib.sha256(skills_json.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,139 @@
+# Skill_tables.py keeps normalized skill tables and rollups next to the jobs table for the dashboard
+# skills holds one row per skill and job_skills bridges jobs to their skills
+# skill_stats and skill_pairs hold the job counts and salary sums per skill and per pair of skills,
+# they are updated incrementally with the jobs inserted or re-skilled by each load, so the dashboard never has to unnest the whole jobs table
+# The skill_summary and skill_pair_summary views put skill names and averages on the rollups
+
+# Create the skill tables, indexes and views if they don't exist
+# Jobs loaded before the skill tables existed are added to them once, when the tables are created
+def create_skill_tables(cursor):
+    cursor.execute("SELECT to_regclass('job_skills') IS NULL")
+    backfill = cursor.fetchone()[0]
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS jobs_req_skill_idx ON jobs USING GIN (req_skill);
+
+        CREATE TABLE IF NOT EXISTS skills (
+            skill_id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS job_skills (
+            job_id CHAR(32) REFERENCES jobs (job_id) ON DELETE CASCADE,
+            skill_id INTEGER REFERENCES skills (skill_id),
+            PRIMARY KEY (job_id, skill_id)
+        );
+        CREATE INDEX IF NOT EXISTS job_skills_skill_id_idx ON job_skills (skill_id);
+
+        CREATE TABLE IF NOT EXISTS skill_stats (
+            skill_id INTEGER PRIMARY KEY REFERENCES skills (skill_id),
+            job_count BIGINT NOT NULL,
+            salary_sum NUMERIC NOT NULL,
+            salary_count BIGINT NOT NULL,
+            hourly_rate_sum NUMERIC NOT NULL,
+            hourly_rate_count BIGINT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS skill_pairs (
+            skill_id_a INTEGER REFERENCES skills (skill_id),
+            skill_id_b INTEGER REFERENCES skills (skill_id),
+            job_count BIGINT NOT NULL,
+            PRIMARY KEY (skill_id_a, skill_id_b)
+        );
+
+        CREATE OR REPLACE VIEW skill_summary AS
+            SELECT s.name AS skill, st.job_count,
+                   ROUND(st.salary_sum / NULLIF(st.salary_count, 0), 2) AS salary_avg,
+                   ROUND(st.hourly_rate_sum / NULLIF(st.hourly_rate_count, 0), 2) AS hourly_rate_avg
+            FROM skill_stats st
+            JOIN skills s USING (skill_id);
+
+        CREATE OR REPLACE VIEW skill_pair_summary AS
+            SELECT LEAST(a.name, b.name) AS skill_a, GREATEST(a.name, b.name) AS skill_b, p.job_count
+            FROM skill_pairs p
+            JOIN skills a ON a.skill_id = p.skill_id_a
+            JOIN skills b ON b.skill_id = p.skill_id_b;
+    """)
+
+    create_new_jobs_table(cursor)
+    if backfill:
+        cursor.execute("INSERT INTO new_jobs SELECT job_id FROM jobs ON CONFLICT DO NOTHING;")
+        update_skill_tables(cursor)
+
+# Temporary tables of the jobs inserted, and of the jobs whose skills were changed (e.g. after the skills dictionary changed),
+# since the skill tables were last updated, see load.py
+def create_new_jobs_table(cursor):
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS new_jobs (job_id CHAR(32) PRIMARY KEY);
+        CREATE TEMP TABLE IF NOT EXISTS changed_jobs (job_id CHAR(32) PRIMARY KEY);
+    """)
+
+# Add the jobs in new_jobs to the skill tables and rollups, then empty new_jobs
+# Jobs in changed_jobs are taken out of the rollups with their old skills first and then added back like new jobs.
+# Only the skills of a job are ever changed, so subtracting and adding its counts and sums keeps the rollups exact
+def update_skill_tables(cursor):
+    cursor.execute("""
+        UPDATE skill_stats st SET
+            job_count = st.job_count - old.job_count,
+            salary_sum = st.salary_sum - old.salary_sum,
+            salary_count = st.salary_count - old.salary_count,
+            hourly_rate_sum = st.hourly_rate_sum - old.hourly_rate_sum,
+            hourly_rate_count = st.hourly_rate_count - old.hourly_rate_count
+        FROM (
+            SELECT js.skill_id, COUNT(*) AS job_count, COALESCE(SUM(j.salary_avg), 0) AS salary_sum, COUNT(j.salary_avg) AS salary_count,
+                   COALESCE(SUM(j.hourly_rate_avg), 0) AS hourly_rate_sum, COUNT(j.hourly_rate_avg) AS hourly_rate_count
+            FROM changed_jobs c JOIN jobs j USING (job_id) JOIN job_skills js USING (job_id)
+            GROUP BY js.skill_id
+        ) old
+        WHERE st.skill_id = old.skill_id;
+        DELETE FROM skill_stats WHERE job_count = 0;
+
+        UPDATE skill_pairs p SET job_count = p.job_count - old.job_count
+        FROM (
+            SELECT a.skill_id AS skill_id_a, b.skill_id AS skill_id_b, COUNT(*) AS job_count
+            FROM changed_jobs c JOIN job_skills a USING (job_id) JOIN job_skills b ON b.job_id = a.job_id AND a.skill_id < b.skill_id
+            GROUP BY a.skill_id, b.skill_id
+        ) old
+        WHERE p.skill_id_a = old.skill_id_a AND p.skill_id_b = old.skill_id_b;
+        DELETE FROM skill_pairs WHERE job_count = 0;
+
+        DELETE FROM job_skills js USING changed_jobs c WHERE js.job_id = c.job_id;
+        INSERT INTO new_jobs SELECT job_id FROM changed_jobs ON CONFLICT DO NOTHING;
+        TRUNCATE changed_jobs;
+
+        INSERT INTO skills (name)
+        SELECT DISTINCT skill FROM new_jobs n JOIN jobs j USING (job_id), unnest(j.req_skill) AS skill
+        ORDER BY skill
+        ON CONFLICT (name) DO NOTHING;
+
+        INSERT INTO job_skills (job_id, skill_id)
+        SELECT DISTINCT j.job_id, s.skill_id FROM new_jobs n JOIN jobs j USING (job_id), unnest(j.req_skill) AS skill
+        JOIN skills s ON s.name = skill
+        ON CONFLICT DO NOTHING;
+
+        INSERT INTO skill_stats AS st (skill_id, job_count, salary_sum, salary_count, hourly_rate_sum, hourly_rate_count)
+        SELECT js.skill_id, COUNT(*), COALESCE(SUM(j.salary_avg), 0), COUNT(j.salary_avg), COALESCE(SUM(j.hourly_rate_avg), 0), COUNT(j.hourly_rate_avg)
+        FROM new_jobs n JOIN jobs j USING (job_id) JOIN job_skills js USING (job_id)
+        GROUP BY js.skill_id
+        ON CONFLICT (skill_id) DO UPDATE SET
+            job_count = st.job_count + EXCLUDED.job_count,
+            salary_sum = st.salary_sum + EXCLUDED.salary_sum,
+            salary_count = st.salary_count + EXCLUDED.salary_count,
+            hourly_rate_sum = st.hourly_rate_sum + EXCLUDED.hourly_rate_sum,
+            hourly_rate_count = st.hourly_rate_count + EXCLUDED.hourly_rate_count;
+
+        INSERT INTO skill_pairs AS p (skill_id_a, skill_id_b, job_count)
+        SELECT a.skill_id, b.skill_id, COUNT(*)
+        FROM new_jobs n JOIN job_skills a USING (job_id) JOIN job_skills b ON b.job_id = a.job_id AND a.skill_id < b.skill_id
+        GROUP BY a.skill_id, b.skill_id
+        ON CONFLICT (skill_id_a, skill_id_b) DO UPDATE SET job_count = p.job_count + EXCLUDED.job_count;
+
+        TRUNCATE new_jobs;
+    """)
+
+# Rebuild the bridge table and the rollups from scratch, e.g. after jobs have been edited or deleted by hand
+def rebuild_skill_tables(cursor):
+    cursor.execute("TRUNCATE job_skills, skill_stats, skill_pairs;")
+    create_new_jobs_table(cursor)
+    cursor.execute("INSERT INTO new_jobs SELECT job_id FROM jobs ON CONFLICT DO NOTHING;")
+    update_skill_tables(cursor)
@@ -0,0 +1,24 @@
+# Staging_formats.py names the staging file formats and maps them to and from file extensions
+# It has no dependencies, so load.py can list and sort staging files without importing pandas or pyarrow (see formats.py)
+
+import os
+
+FILE_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# The format new staging files are written in
+def get_staging_format():
+    staging_format = os.environ.get('PIPELINE_STAGING_FORMAT', 'csv')
+    if staging_format not in FILE_EXTENSIONS:
+        raise ValueError(f"Unknown staging format: {staging_format}")
+    return staging_format
+
+# File extension of a staging format, e.g. '.parquet'
+def file_extension(staging_format):
+    return FILE_EXTENSIONS[staging_format]
+
+# Staging format of a file from its name, None if it isn't a staging file
+def format_of(file_name):
+    for staging_format, extension in FILE_EXTENSIONS.items():
+        if file_name.endswith(extension):
+            return staging_format
+    return None
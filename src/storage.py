@@ -0,0 +1,119 @@
+# Storage.py gives extract, transform and load one interface to the raw and processed datasets
+# Files can be listed, read, written and deleted either in Azure Blob Storage containers or in directories on disk
+# Set PIPELINE_STORAGE_BACKEND=local to keep them under PIPELINE_LOCAL_STORAGE_DIR, e.g. for backfills, benchmarks or offline runs
+# Local files are memory-mapped when read, so they reach pandas and Arrow without being copied into byte strings first
+
+import io
+import mmap
+import os
+from metrics import count
+
+STORAGE_BACKENDS = ('azure', 'local')
+
+# Default directory of the local backend, next to the scripts
+DEFAULT_LOCAL_STORAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# The backend the stages read from and write to
+def get_storage_backend():
+    backend = os.environ.get('PIPELINE_STORAGE_BACKEND', 'azure')
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return backend
+
+# Writable file that is written under a temporary name and renamed into place when closed,
+# so readers never see a half-written file. A with block that raises deletes the temporary file instead.
+class LocalWriteStream(io.FileIO):
+    def __init__(self, path):
+        self.path = path
+        super().__init__(f'{path}.tmp', 'wb')
+
+    def close(self):
+        if not self.closed:
+            count('bytes_written', self.tell())
+            super().close()
+            os.replace(self.name, self.path)
+
+    # Close and delete the temporary file, leaving any earlier file of the same name as it was
+    def abort(self):
+        if not self.closed:
+            super().close()
+            os.remove(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# Files in a directory on disk
+class LocalStorage:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def location(self):
+        return f"directory {self.directory}"
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # All files by name and a version tag made of the modification time and size, which plays the part of the ETag
+    def list_files(self):
+        with os.scandir(self.directory) as entries:
+            return {entry.name: f'{entry.stat().st_mtime_ns}-{entry.stat().st_size}' for entry in entries
+                    if entry.is_file() and not entry.name.endswith('.tmp')}
+
+    # The contents of a file as a read-only memory map, pages are read from disk only when they are accessed
+    def read(self, name):
+        with open(self._path(name), 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            count('bytes_read', size)
+            if size == 0:
+                return b''
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Yield (name, data) pairs in the order of names
+    # Mapping a file is cheap, the reading happens when the caller parses the data
+    def read_many(self, names):
+        for name in names:
+            yield name, self.read(name)
+
+    def open_read(self, name):
+        count('bytes_read', os.path.getsize(self._path(name)))
+        return open(self._path(name), 'rb')
+
+    def write(self, name, data):
+        with self.open_write(name) as file:
+            file.write(data)
+
+    def open_write(self, name):
+        return LocalWriteStream(self._path(name))
+
+    # Delete files, returns the names of the files that could not be deleted
+    def delete(self, names):
+        failed = []
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                failed.append(name)
+        return failed
+
+# Storage of a dataset, a container on Azure Blob Storage or a subdirectory of PIPELINE_LOCAL_STORAGE_DIR
+# The Azure SDK is only imported when the Azure backend is used (see azure_clients.py)
+def get_storage(dataset):
+    if get_storage_backend() == 'local':
+        return LocalStorage(os.path.join(os.environ.get('PIPELINE_LOCAL_STORAGE_DIR', DEFAULT_LOCAL_STORAGE_DIR), dataset))
+
+    from azure_clients import AzureStorage, get_processed_container_client, get_raw_container_client
+    get_container_client = {'raw': get_raw_container_client, 'processed': get_processed_container_client}[dataset]
+    return AzureStorage(get_container_client())
+
+# Storage of the raw data written by extract.py
+def get_raw_storage():
+    return get_storage('raw')
+
+# Storage of the processed data written by transform.py
+def get_processed_storage():
+    return get_storage('processed')
@@ -0,0 +1,42 @@
+# Throttle.py limits how fast the scraper sends requests to the job site
+# The rate is a total across all workers, so adding workers doesn't make the scraper less polite
+# AdaptiveRateLimiter also slows down when the site struggles and speeds up again while it responds quickly
+
+import threading
+from time import monotonic, sleep
+
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self._next_slot = monotonic()
+        self._lock = threading.Lock()
+
+    # Block until the caller may send its next request
+    # Each call reserves the next free time slot, so concurrent callers are spaced out evenly
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+# Rate limiter that adapts to how the site responds
+# The rate is cut in half on error pages, captchas and slow responses, and raised step by step while responses are fast
+class AdaptiveRateLimiter(RateLimiter):
+    def __init__(self, requests_per_second, min_requests_per_second=0.1, max_requests_per_second=2.0, slow_seconds=10, step=0.05):
+        super().__init__(requests_per_second)
+        self.requests_per_second = requests_per_second
+        self.min_requests_per_second = min_requests_per_second
+        self.max_requests_per_second = max_requests_per_second
+        self.slow_seconds = slow_seconds
+        self.step = step
+
+    # Report the outcome of a request: whether it succeeded and how many seconds the page took to become ready
+    def record(self, success, seconds):
+        with self._lock:
+            if not success or seconds >= self.slow_seconds:
+                self.requests_per_second = max(self.min_requests_per_second, self.requests_per_second / 2)
+            else:
+                self.requests_per_second = min(self.max_requests_per_second, self.requests_per_second + self.step)
+            self.interval = 1 / self.requests_per_second
@@ -2,65 +2,93 @@
 # E.g. string cleaning, salary parsing, job description mapped against a skills/technologies list
 
 # Import needed libraries
+import io
+import json
 import numpy as np
-import os
 import pandas as pd
-import re
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 from data_eng_skills import data_engineering_skills
-from io import StringIO
-
-# Load all .csv-files from the raw data folder to one dataframe
-def load_raw_data():
-    # Set up Azure Key Vault client
-    key_vault_url = os.environ.get('AZURE_KEY_VAULT_URL')
-    credential = DefaultAzureCredential()
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    # Retrieve the connection string from Azure Key Vault
-    connection_string = secret_client.get_secret(os.environ.get('AZURE_STORAGE_CONNECTION_STRING_SECRET_NAME')).value
-
-    # Create the BlobServiceClient
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-
-    # Get a reference to the container
-    container_name = os.environ.get('AZURE_RAW_STORAGE_CONTAINER_NAME')
-    container_client = blob_service_client.get_container_client(container_name)
-
-    # List all blobs in the container
-    blob_list = container_client.list_blobs()
-
+from formats import PROCESSED_SCHEMA, iter_parquet_chunks, read_frame, serialize_frame
+from metrics import count, span, timer
+from skill_cache import match_series_cached
+from skill_matcher import get_skill_matcher, skills_version
+from staging_formats import file_extension, format_of, get_staging_format
+from storage import get_processed_storage, get_raw_storage
+
+# Manifest of the raw blobs that have already been transformed, stored next to the raw data
+# It records each blob by name and ETag (or file by modification time and size, see storage.py),
+# and the version of the skills dictionary they were processed with
+MANIFEST_BLOB_NAME = '_transform_manifest.json'
+
+# Read the manifest, an empty one if no run has written it yet
+def load_manifest(storage):
+    try:
+        manifest_data = storage.read(MANIFEST_BLOB_NAME)
+    except FileNotFoundError:
+        return {'skills_version': None, 'blobs': {}}
+    return json.loads(bytes(manifest_data))
+
+# Write the manifest back next to the raw data
+def save_manifest(storage, manifest):
+    storage.write(MANIFEST_BLOB_NAME, json.dumps(manifest, indent=2).encode('utf-8'))
+
+# List the raw .csv- and .parquet-files by name and ETag, leaving out those in processed_blobs with an unchanged ETag
+def list_new_raw_blobs(storage, processed_blobs=None):
+    processed_blobs = processed_blobs or {}
+    return {name: etag for name, etag in storage.list_files().items()
+            if format_of(name) is not None and processed_blobs.get(name) != etag}
+
+# Load the raw files from the raw data folder to one dataframe
+# Blobs listed in processed_blobs with an unchanged ETag are skipped
+# Returns the dataframe (None if there was nothing new) and the loaded blobs by name and ETag
+def load_raw_data(storage, processed_blobs=None):
+    loaded_blobs = list_new_raw_blobs(storage, processed_blobs)
+
+    # Blobs are downloaded concurrently while the already downloaded ones are parsed, local files are memory-mapped
     all_df = []
-    for blob in blob_list:
-        if blob.name.endswith('.csv'):
-            # Download the blob content
-            blob_client = container_client.get_blob_client(blob.name)
-            blob_data = blob_client.download_blob().readall().decode('utf-8')
-            
-            # Create a DataFrame from the blob data
-            df = pd.read_csv(StringIO(blob_data), sep=";", header=0)
-            all_df.append(df)
-
-    return pd.concat(all_df, ignore_index=True)
+    for blob_name, blob_data in storage.read_many(loaded_blobs):
+        # Create a DataFrame from the blob data, every column is read as text like in the chunked path
+        df = read_frame(blob_data, format_of(blob_name), dtype=str)
+        all_df.append(df)
+
+    if not all_df:
+        return None, loaded_blobs
+    return pd.concat(all_df, ignore_index=True), loaded_blobs
+
+# Read raw files in dataframes of at most chunk_size rows
+# .csv-files are streamed without downloading them as a whole, compressed .parquet-files are downloaded and read by row batches
+def read_raw_chunks(storage, blob_names, chunk_size):
+    for blob_name in blob_names:
+        if format_of(blob_name) == 'parquet':
+            yield from iter_parquet_chunks(storage.read(blob_name), chunk_size)
+            continue
+        with io.TextIOWrapper(storage.open_read(blob_name), encoding='utf-8', newline='') as stream:
+            # Read every column as text, a chunk where a column happens to be empty is cleaned with the text() casts in clean_data
+            for df in pd.read_csv(stream, sep=";", header=0, dtype=str, chunksize=chunk_size):
+                yield df
+
+# A column as object dtype, so that its .str methods work also when it holds no strings at all
+# A small file or chunk often has no salary or job type, such a column would otherwise be all-NaN floats
+def text(column):
+    return column.astype(object)
 
 # Clean the data
 # Remove unnecessary words and characters from the data
 def clean_data(df):
-    df['Job ID'] = df['Job ID'].str.replace('job_', '')
-    df['Location'] = df['Location'].str.replace('Hybrid work in', '').str.replace('Remote in', '')
-    df['Location'] = df['Location'].str.replace(r'\b\d{5}\S*', '', regex=True).str.strip() # Remove zip codes from 'Location'
-    df['Location'] = df['Location'].str.replace(r'\([^)]*\)', '', regex=True).str.strip() # Remove trailing words inside parentheses
-    df['Job Type'] = df['Job Type'].str.replace(r'(?<!\w)-(?!\w)', '', regex=True).str.strip() # Remove single dashes when they're not part of a word
-    df['Job Type'] = df['Job Type'].str.split().str[0] # Remove trailing words from 'Job Type' 
-    df['Job Type'] = df['Job Type'].str.rstrip(',')
-    df['Job Type'] = df['Job Type'].str.replace('Temporary', 'Part-time').str.replace('Permanent', 'Full-time').str.replace('Temp-to-hire', 'Part-time')
-    df['Salary'] = df['Salary'].str.replace('$', '').str.replace('From', '').str.replace('a year', '').str.replace('an hour', '').str.strip() # Remove non-numeric strings from Salary
-    df[['Salary_Lower', 'Salary_Upper']] = df['Salary'].str.split('-', expand=True) # Split salary to a range located in two columns
-    df['Salary_Lower'] = df['Salary_Lower'].str.rstrip().str.replace(',', '')
-    df['Salary_Upper'] = df['Salary_Upper'].str.rstrip().str.replace(',', '')
+    df['Job ID'] = text(df['Job ID']).str.replace('job_', '')
+    df['Location'] = text(df['Location']).str.replace('Hybrid work in', '').str.replace('Remote in', '')
+    df['Location'] = text(df['Location']).str.replace(r'\b\d{5}\S*', '', regex=True).str.strip() # Remove zip codes from 'Location'
+    df['Location'] = text(df['Location']).str.replace(r'\([^)]*\)', '', regex=True).str.strip() # Remove trailing words inside parentheses
+    df['Job Type'] = text(df['Job Type']).str.replace(r'(?<!\w)-(?!\w)', '', regex=True).str.strip() # Remove single dashes when they're not part of a word
+    df['Job Type'] = text(df['Job Type']).str.split().str[0] # Remove trailing words from 'Job Type' 
+    df['Job Type'] = text(df['Job Type']).str.rstrip(',')
+    df['Job Type'] = text(df['Job Type']).str.replace('Temporary', 'Part-time').str.replace('Permanent', 'Full-time').str.replace('Temp-to-hire', 'Part-time')
+    df['Salary'] = text(df['Salary']).str.replace('$', '').str.replace('From', '').str.replace('a year', '').str.replace('an hour', '').str.strip() # Remove non-numeric strings from Salary
+    df[['Salary_Lower', 'Salary_Upper']] = text(df['Salary']).str.split('-', n=1, expand=True).reindex(columns=[0, 1]).astype(object) # Split salary to a range located in two columns, also when no row (e.g. in a chunk) has a range
+    df['Salary_Lower'] = text(df['Salary_Lower']).str.rstrip().str.replace(',', '')
+    df['Salary_Upper'] = text(df['Salary_Upper']).str.rstrip().str.replace(',', '')
     
     # Cast the data to the correct data types
     df['Job ID'] = df['Job ID'].astype('str')
@@ -87,58 +115,91 @@ def clean_data(df):
 
 # Transform the data
 # Calculate average salary, extract key skills and technologies from the job description
+# Descriptions that have been matched before are looked up from the skill cache, see skill_cache.py
 def process_data(df):
     df['Salary_Avg'] = df[['Salary_Upper', 'Salary_Lower']].mean(axis=1, skipna=True)
     df['Hourly_Rate_Avg'] = df[['Hourly_Rate_Lower', 'Hourly_Rate_Upper']].mean(axis=1, skipna=True)
-    df['Req_Skills'] = df['Full Job Description'].apply(lambda desc: extract_skills(desc, data_engineering_skills))
+    with timer('skill_match_seconds'):
+        df['Req_Skills'] = match_series_cached(df['Full Job Description'], data_engineering_skills)
+    count('rows_transformed', len(df))
     return df[['Job ID', 'Title', 'Company', 'Location', 'Salary_Lower', 'Salary_Avg', 'Salary_Upper', 'Hourly_Rate_Lower', 'Hourly_Rate_Avg', 'Hourly_Rate_Upper', 'Job Type', 'Req_Skills']]
 
 # Function to extract key skills and technologies from the job description
+# The matcher is compiled once from the skills dictionary and finds all skills in a single pass
 def extract_skills(description, skills_dict):
-    found_skills = []
-    description_lower = description.lower()
-
-    # Treat R as a special case, since otherwise the presence of letter 'R' would cause incorrect matches
-    r_pattern = r'\b(R\b|R,|R programming|R language|R studio)\b'
-    if re.search(r_pattern, description, re.IGNORECASE):
-        found_skills.append('R')
-
-    # Extract all other skills and technologies
-    for skill, variations in skills_dict.items():
-        if any(variation.lower() in description_lower for variation in variations):
-            found_skills.append(skill)
+    return get_skill_matcher(skills_dict).match(description)
 
-    return found_skills
-
-# Save the processed data to a .csv-file on Azure Blob Storage
-def save_processed_data(df):
-    # Define the container and file name
+# Name of a new timestamped processed file in the given staging format
+def get_processed_blob_name(staging_format):
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    CONTAINER_NAME = os.environ.get('AZURE_PROCESSED_STORAGE_CONTAINER_NAME')
-    BLOB_NAME = f'data_eng_info_processed_{current_time}.csv'
-
-    # Set up Azure Key Vault client
-    key_vault_url = os.environ.get('AZURE_KEY_VAULT_URL')
-    credential = DefaultAzureCredential()
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    # Retrieve the connection string from Azure Key Vault
-    PASS_TOKEN = secret_client.get_secret(os.environ.get('AZURE_STORAGE_CONNECTION_STRING_SECRET_NAME')).value
+    return f'data_eng_info_processed_{current_time}{file_extension(staging_format)}'
 
-    # Create the BlobServiceClient using the retrieved connection string
-    BLOB_SERVICE_CLIENT = BlobServiceClient.from_connection_string(PASS_TOKEN)
-
-    # Create a blob client
-    blob_client = BLOB_SERVICE_CLIENT.get_blob_client(container=CONTAINER_NAME, blob=BLOB_NAME)
-
-    # Upload the DataFrame directly to Azure Blob Storage
-    csv_data = df.to_csv(sep=';', index=False).encode('utf-8')
-    blob_client.upload_blob(csv_data, overwrite=True)
-    print(f"Processed data uploaded to blob {BLOB_NAME} in container {CONTAINER_NAME}.")
+# Save the processed data to a .csv-file (or .parquet-file, see formats.py) on Azure Blob Storage or on disk (see storage.py)
+def save_processed_data(df):
+    staging_format = get_staging_format()
+    storage = get_processed_storage()
+    BLOB_NAME = get_processed_blob_name(staging_format)
+
+    # Write the DataFrame directly to storage
+    file_data = serialize_frame(df, staging_format, PROCESSED_SCHEMA)
+    storage.write(BLOB_NAME, file_data)
+    print(f"Processed data saved to {BLOB_NAME} in {storage.location}.")
+
+# Save processed dataframes to one file, writing it out as the dataframes come in
+# Only one dataframe is held in memory at a time, the file appears once it has been written completely
+# (on Azure Blob Storage it is uploaded in blocks that are committed at the end), and not at all if a chunk fails
+def save_processed_chunks(frames):
+    staging_format = get_staging_format()
+    storage = get_processed_storage()
+    BLOB_NAME = get_processed_blob_name(staging_format)
+
+    chunk_count = 0
+    with storage.open_write(BLOB_NAME) as stream:
+        if staging_format == 'parquet':
+            # Each dataframe becomes one row group of the Parquet file
+            with pq.ParquetWriter(stream, PROCESSED_SCHEMA, compression='zstd') as writer:
+                for df in frames:
+                    writer.write_table(pa.Table.from_pandas(df, schema=PROCESSED_SCHEMA, preserve_index=False))
+                    chunk_count += 1
+        else:
+            for df in frames:
+                stream.write(df.to_csv(sep=';', index=False, header=(chunk_count == 0)).encode('utf-8'))
+                chunk_count += 1
+
+    print(f"Processed data saved to {BLOB_NAME} in {storage.location} in {chunk_count} chunks.")
 
 # Main function to transform the data
-def transform_data():
-    df = load_raw_data()
-    df = clean_data(df)
-    df = process_data(df)
-    save_processed_data(df)
\ No newline at end of file
+# Only raw blobs that haven't been transformed yet are processed
+# Everything is reprocessed with full_refresh=True, or automatically when data_eng_skills has changed
+# With chunk_size, the raw data is streamed through clean_data and process_data in chunks of that many rows
+@span('transform')
+def transform_data(full_refresh=False, chunk_size=None):
+    storage = get_raw_storage()
+    manifest = load_manifest(storage)
+
+    current_skills_version = skills_version(data_engineering_skills)
+    if full_refresh or manifest['skills_version'] != current_skills_version:
+        print("Reprocessing all raw data.")
+        manifest = {'skills_version': current_skills_version, 'blobs': {}}
+
+    if chunk_size:
+        loaded_blobs = list_new_raw_blobs(storage, manifest['blobs'])
+        if not loaded_blobs:
+            print("No new raw data to transform.")
+            return
+
+        chunks = read_raw_chunks(storage, loaded_blobs, chunk_size)
+        save_processed_chunks(process_data(clean_data(df)) for df in chunks)
+    else:
+        df, loaded_blobs = load_raw_data(storage, manifest['blobs'])
+        if df is None:
+            print("No new raw data to transform.")
+            return
+
+        df = clean_data(df)
+        df = process_data(df)
+        save_processed_data(df)
+
+    # Record the transformed blobs only after the processed data has been saved
+    manifest['blobs'].update(loaded_blobs)
+    save_manifest(storage, manifest)
\ No newline at end of file
@@ -0,0 +1,34 @@
+# Puts src/ and benchmarks/ on the import path, the scripts import each other as top-level modules
+# and holds the fixtures shared by the test modules
+
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from formats import RAW_SCHEMA  # noqa: E402 (needs src/ on the path)
+
+# Raw rows without any salary or job type, like a run where no new posting shows them
+RAW_ROWS = [
+    ('job_1', 'Data Engineer', 'Acme', 'Remote in Austin, TX 78701', np.nan, np.nan, 'Python and SQL'),
+    ('job_2', 'Data Engineer', 'Beta', 'Chicago, IL (Loop area)', np.nan, np.nan, 'Spark and Airflow'),
+]
+
+# Staging files on disk in a temporary directory, in CSV and without the skill cache
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    monkeypatch.setenv('PIPELINE_STORAGE_BACKEND', 'local')
+    monkeypatch.setenv('PIPELINE_LOCAL_STORAGE_DIR', str(tmp_path))
+    monkeypatch.setenv('SKILL_CACHE_PATH', '')
+    monkeypatch.setenv('PIPELINE_STAGING_FORMAT', 'csv')
+    return tmp_path
+
+# A raw dataframe of RAW_ROWS, each test gets its own copy to modify
+@pytest.fixture
+def raw_frame():
+    return pd.DataFrame(RAW_ROWS, columns=RAW_SCHEMA.names, dtype=object)
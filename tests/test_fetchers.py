@@ -0,0 +1,155 @@
+# The HTTP backend and its Selenium fallback, run against a local HTTP server serving synthetic pages
+
+import http.server
+import threading
+import pytest
+import synthetic
+from driver_pool import DriverPool
+from fetchers import HttpFetcher, PageReady, SeleniumFetcher, build_fetcher, load_page
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+from throttle import AdaptiveRateLimiter
+
+# The same as in extract.py, which needs config.py to be imported
+SEARCH_PAGE_READY = PageReady('div.job_seen_beacon', 'job_seen_beacon')
+DETAILS_PAGE_READY = PageReady('#jobDescriptionText', 'jobDescriptionText')
+
+# Pages served by the fixture server by path, with their status codes
+PAGES = {
+    '/jobs': (200, synthetic.make_search_page(15)),
+    '/viewjob': (200, synthetic.make_details_page()),
+    '/blocked': (403, '<html><body>Access denied</body></html>'),
+    '/captcha': (200, '<html><body><form id="captcha">Verify you are a human</form></body></html>'),
+    '/missing': (404, '<html><body>Not found</body></html>'),
+}
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, page = PAGES[self.path]
+        body = page.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+# Stand-in for the Selenium fetcher that records the pages it was asked for
+class RecordingFetcher:
+    def __init__(self):
+        self.urls = []
+
+    def fetch(self, url, ready):
+        self.urls.append(url)
+        return '<html><body>rendered</body></html>'
+
+def rate_limiter():
+    return AdaptiveRateLimiter(10, max_requests_per_second=20)
+
+@pytest.mark.parametrize('path, ready', [('/jobs', SEARCH_PAGE_READY), ('/viewjob', DETAILS_PAGE_READY)])
+def test_http_fetcher_returns_pages_with_markup(base_url, path, ready):
+    limiter = rate_limiter()
+    page_source = HttpFetcher(limiter).fetch(base_url + path, ready)
+    assert ready.marker in page_source
+    assert limiter.requests_per_second > 10
+
+@pytest.mark.parametrize('path', ['/blocked', '/captcha'])
+def test_block_and_captcha_pages_slow_down_the_crawl(base_url, path):
+    limiter = rate_limiter()
+    assert HttpFetcher(limiter).fetch(base_url + path, SEARCH_PAGE_READY) is None
+    assert limiter.requests_per_second == 5
+
+def test_missing_page_does_not_slow_down_the_crawl(base_url):
+    limiter = rate_limiter()
+    assert HttpFetcher(limiter).fetch(base_url + '/missing', SEARCH_PAGE_READY) is None
+    assert limiter.requests_per_second > 10
+
+def test_http_backend_falls_back_to_selenium_for_good_after_repeated_misses(base_url):
+    limiter = rate_limiter()
+    fetcher = build_fetcher('http', None, limiter)
+    fetcher.fallback = RecordingFetcher()
+
+    for _ in range(5):
+        fetcher.fetch(base_url + '/captcha', SEARCH_PAGE_READY)
+    # The HTTP probes of the first three pages don't slow down the crawl Chrome shares, and then only Chrome is used
+    assert limiter.requests_per_second == 10
+    assert fetcher.fallback_only
+    assert fetcher.fetch(base_url + '/jobs', SEARCH_PAGE_READY) == '<html><body>rendered</body></html>'
+    assert len(fetcher.fallback.urls) == 6
+
+def test_http_backend_falls_back_to_selenium_only_when_needed(base_url):
+    fetcher = build_fetcher('http', None, rate_limiter())
+    assert isinstance(fetcher.primary, HttpFetcher)
+    fetcher.fallback = RecordingFetcher()
+
+    assert SEARCH_PAGE_READY.marker in fetcher.fetch(base_url + '/jobs', SEARCH_PAGE_READY)
+    assert fetcher.fallback.urls == []
+
+    assert fetcher.fetch(base_url + '/captcha', SEARCH_PAGE_READY) == '<html><body>rendered</body></html>'
+    assert fetcher.fallback.urls == [base_url + '/captcha']
+
+# Stand-in for a Chrome session, crashes on every page if crashed is set
+class FakeDriver:
+    def __init__(self, crashed):
+        self.crashed = crashed
+        self.window_handles = ['window']
+        self.page_source = ''
+
+    def get(self, url):
+        if self.crashed:
+            raise WebDriverException("chrome not reachable")
+        self.page_source = f'<html><body><div class="job_seen_beacon">{url}</div></body></html>'
+
+    def find_element(self, by, value):
+        return object()
+
+    def quit(self):
+        pass
+
+# Driver pool whose first sessions crash, counting the sessions it starts
+class CrashingDriverPool(DriverPool):
+    def __init__(self, crashing_sessions):
+        super().__init__(options=None, size=1)
+        self.crashing_sessions = crashing_sessions
+        self.started = 0
+
+    def _start_driver(self):
+        self.started += 1
+        return FakeDriver(crashed=self.started <= self.crashing_sessions)
+
+def test_crashed_session_is_retried_on_a_fresh_session():
+    driver_pool = CrashingDriverPool(crashing_sessions=1)
+    page_source = SeleniumFetcher(driver_pool, rate_limiter()).fetch('http://jobs/viewjob', SEARCH_PAGE_READY)
+    assert 'http://jobs/viewjob' in page_source
+    assert driver_pool.started == 2
+
+def test_page_is_skipped_when_the_retry_crashes_too():
+    driver_pool = CrashingDriverPool(crashing_sessions=2)
+    assert SeleniumFetcher(driver_pool, rate_limiter()).fetch('http://jobs/viewjob', SEARCH_PAGE_READY) is None
+    assert driver_pool.started == 2
+
+# Chrome session showing a page that never gets the expected element, like a captcha
+class CaptchaDriver(FakeDriver):
+    def __init__(self):
+        super().__init__(crashed=False)
+        self.page_source = '<html><body>Verify you are a human</body></html>'
+
+    def get(self, url):
+        pass
+
+    def find_element(self, by, value):
+        raise NoSuchElementException(value)
+
+def test_page_without_the_element_is_not_returned():
+    limiter = rate_limiter()
+    assert load_page(CaptchaDriver(), 'http://jobs/viewjob', '#jobDescriptionText', limiter, timeout=0.1) is None
+    assert limiter.requests_per_second == 5
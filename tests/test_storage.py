@@ -0,0 +1,112 @@
+# Streamed writes only publish a file once it has been written completely
+
+import azure_clients
+import pytest
+from azure_clients import AzureStorage
+from storage import LocalStorage, get_storage
+from types import SimpleNamespace
+from transform import save_processed_chunks
+
+# Stand-ins for the Azure blob clients that keep blobs and staged blocks in memory
+class FakeBlobClient:
+    def __init__(self, blobs, name):
+        self.blobs = blobs
+        self.name = name
+        self.staged = {}
+
+    def upload_blob(self, data, overwrite=False):
+        self.blobs[self.name] = data
+
+    def download_blob(self):
+        data = self.blobs[self.name]
+        return SimpleNamespace(readall=lambda: data)
+
+    def stage_block(self, block_id, data):
+        self.staged[block_id] = data
+
+    def commit_block_list(self, block_list):
+        self.blobs[self.name] = b''.join(self.staged[block.id] for block in block_list)
+
+class FakeContainerClient:
+    def __init__(self, container_name='processed'):
+        self.container_name = container_name
+        self.blobs = {}
+
+    def list_blobs(self):
+        return [SimpleNamespace(name=name, etag=str(len(data))) for name, data in self.blobs.items()]
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self.blobs, name)
+
+class FakeBlobServiceClient:
+    def __init__(self, connection_string=None):
+        self.connection_string = connection_string
+        self.containers = {}
+
+    @classmethod
+    def from_connection_string(cls, connection_string):
+        return cls(connection_string)
+
+    def get_container_client(self, container_name):
+        return self.containers.setdefault(container_name, FakeContainerClient(container_name))
+
+@pytest.fixture
+def azure_env(monkeypatch):
+    monkeypatch.setenv('PIPELINE_STORAGE_BACKEND', 'azure')
+    monkeypatch.setenv('AZURE_RAW_STORAGE_CONTAINER_NAME', 'raw')
+    monkeypatch.setenv('AZURE_PROCESSED_STORAGE_CONTAINER_NAME', 'processed')
+    yield
+    azure_clients.set_blob_service_client(None)
+
+# Processed frames where the second one fails, like a chunk that clean_data can't handle
+def failing_frames(frame):
+    yield frame
+    raise ValueError("bad chunk")
+
+# Write one file completely and fail while writing another
+def write_complete_and_partial(storage):
+    with storage.open_write('complete.csv') as stream:
+        stream.write(b'a;b\n')
+
+    with pytest.raises(ValueError):
+        with storage.open_write('partial.csv') as stream:
+            stream.write(b'a;b\n')
+            raise ValueError("failed while writing")
+
+def test_failed_local_stream_is_not_published(tmp_path):
+    write_complete_and_partial(LocalStorage(str(tmp_path)))
+    # Also the temporary file is gone
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['complete.csv']
+
+def test_failed_block_upload_is_not_committed():
+    container_client = FakeContainerClient()
+    write_complete_and_partial(AzureStorage(container_client))
+    assert container_client.blobs == {'complete.csv': b'a;b\n'}
+
+def test_save_processed_chunks_publishes_nothing_on_error(local_storage, raw_frame):
+    with pytest.raises(ValueError):
+        save_processed_chunks(failing_frames(raw_frame))
+    assert list((local_storage / 'processed').iterdir()) == []
+
+def test_azure_storage_runs_on_the_given_blob_service_client(azure_env):
+    blob_service_client = FakeBlobServiceClient()
+    azure_clients.set_blob_service_client(blob_service_client)
+
+    storage = get_storage('raw')
+    storage.write('jobs.csv', b'a;b\n')
+    assert storage.location == 'container raw'
+    assert list(storage.list_files()) == ['jobs.csv']
+    assert storage.read('jobs.csv') == b'a;b\n'
+    assert blob_service_client.containers['raw'].blobs == {'jobs.csv': b'a;b\n'}
+
+def test_blob_clients_are_rebuilt_when_the_connection_string_changes(azure_env, monkeypatch):
+    monkeypatch.setattr(azure_clients, 'BlobServiceClient', FakeBlobServiceClient)
+    monkeypatch.setenv('AZURE_STORAGE_CONNECTION_STRING', 'key1')
+    azure_clients.set_blob_service_client(None)
+    first = get_storage('raw').container_client
+    assert get_storage('raw').container_client is first
+
+    # E.g. the storage key was rotated and the Key Vault secret fetched again after its TTL
+    monkeypatch.setenv('AZURE_STORAGE_CONNECTION_STRING', 'key2')
+    assert get_storage('raw').container_client is not first
+    assert azure_clients.get_blob_service_client().connection_string == 'key2'
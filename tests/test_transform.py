@@ -0,0 +1,32 @@
+# Transform runs on small batches of new raw files, where a column often has no value in any row
+
+import pytest
+from formats import RAW_SCHEMA, read_frame, serialize_frame
+from storage import get_raw_storage
+from transform import clean_data, transform_data
+
+@pytest.mark.parametrize('staging_format', ['csv', 'parquet'])
+def test_clean_data_with_all_missing_salary_and_job_type(raw_frame, staging_format):
+    data = serialize_frame(raw_frame, staging_format, RAW_SCHEMA)
+    df = clean_data(read_frame(data, staging_format, dtype=str))
+
+    assert list(df['Job ID']) == ['1', '2']
+    assert list(df['Location']) == ['Austin, TX', 'Chicago, IL']
+    assert df['Salary_Lower'].isna().all() and df['Salary_Upper'].isna().all()
+    assert df['Hourly_Rate_Lower'].isna().all() and df['Hourly_Rate_Upper'].isna().all()
+
+@pytest.mark.parametrize('staging_format', ['csv', 'parquet'])
+@pytest.mark.parametrize('chunk_size', [None, 1])
+def test_transform_data_with_all_missing_salary_and_job_type(local_storage, raw_frame, staging_format, chunk_size):
+    # Only the second row has a job type, so chunks of one row see a column without values
+    raw_frame.loc[1, 'Job Type'] = 'Full-time -'
+    get_raw_storage().write(f'raw.{staging_format}', serialize_frame(raw_frame, staging_format, RAW_SCHEMA))
+
+    transform_data(chunk_size=chunk_size)
+
+    processed_files = list((local_storage / 'processed').iterdir())
+    assert len(processed_files) == 1
+    processed = read_frame(processed_files[0].read_bytes(), 'csv')
+    assert list(processed['Job ID']) == [1, 2]
+    assert processed['Salary_Avg'].isna().all()
+    assert processed.loc[1, 'Job Type'] == 'Full-time'